@@ -11,12 +11,13 @@ from Marionette import *
 class Action(object):
     """"""
     def __init__(self, target, timeInterval):
-        self.target = target
+        # target angles as an array (NaN where the motor does not move, see toAngleArray)
+        self.target = toAngleArray(target)
         self.timeInterval = timeInterval # seconds
         # TODO: check target angles are valid (assumed for now)
 
-        # Marionette: Used for conversion
-        self.marionette = Marionette()
+        # Marionette: Used for conversion (shared, read-only)
+        self.marionette = getMarionetteModel()
 
 
     def getCmdsToTarget(self, origin, speeds):
@@ -39,24 +40,75 @@ class Action(object):
             print "Invalid speeds number ", len(speeds)
             raise InvalidSpeedsNumber
 
-        output = []
-        for originAngle, targetAngle, speed, motor in zip(origin, self.target, speeds, self.marionette.motorList):
-            if targetAngle is None or targetAngle == originAngle or speed == 0:
-                # No motion requested: pass
-                pass
-            else:
-                info = []
-                info.append(motor.name)
-                info.append(targetAngle)
-                info.append(speed)
-                output.append(info)
-
-        return output
+        return getCmdsToTargets(origin, self.target, speeds)[0]
 
     def getLastTargetAngles(self):
         return self.lastTargetAngles
 
 
+### Static methods
+# Angles are handled as float arrays in the order of the motors (see Marionette.MOTOR_KEYS), where NaN
+# means that the motor does not move. All the functions work on one pose or on a batch of poses (one per row).
+
+def toAngleArray(angles):
+    """Converts a list of angles (None for the motors that do not move) or a list of such lists to an array."""
+    return np.array(angles, dtype=float)
+
+
+def motorsToMove(origin, targets, speeds):
+    """
+    The motors that need a command to reach the targets.
+
+    Args:
+        origin (list): current angles.
+        targets (np.array): target angles (NaN for the motors that do not move), one pose or a batch.
+        speeds (list): speeds, one list or one per pose.
+
+    Returns:
+        boolean array, with the shape of targets.
+    """
+    targets = np.asarray(targets, dtype=float)
+    with np.errstate(invalid='ignore'):
+        return ~np.isnan(targets) & (targets != np.asarray(origin, dtype=float)) & (np.asarray(speeds, dtype=float) != 0)
+
+
+def mergeTargets(currentTargets, targets):
+    """The current target angles updated with the new targets (where they are not NaN)."""
+    targets = np.asarray(targets, dtype=float)
+    return np.where(np.isnan(targets), np.asarray(currentTargets, dtype=float), targets)
+
+
+def getCmdsToTargets(origin, targets, speeds):
+    """
+    The commands to send to reach each target pose (see Action.getCmdsToTarget).
+
+    Args:
+        origin (list): current angles.
+        targets (np.array): target angles (NaN for the motors that do not move), one pose or a batch.
+        speeds (list): speeds, one list or one per pose.
+
+    Returns:
+        one list of commands per pose.
+
+    Raises:
+        ValueError if the targets or the speeds do not have one value per motor.
+    """
+    motorNames = getMarionetteModel().motorNames
+    targets = np.atleast_2d(np.asarray(targets, dtype=float))
+    speeds = np.asarray(speeds, dtype=float)
+    if targets.shape[-1] != len(motorNames) or speeds.shape[-1] != len(motorNames):
+        raise ValueError("Invalid angles or speeds number %d, %d (%d motors: %s)"
+                         % (targets.shape[-1], speeds.shape[-1], len(motorNames), ', '.join(MOTOR_KEYS)))
+    speeds = np.broadcast_to(speeds, targets.shape)
+    moving = motorsToMove(origin, targets, speeds)
+    cmds = []
+    for pose, motors in enumerate(moving):
+        indices = np.flatnonzero(motors)
+        cmds.append([[motorNames[i], angle, speed]
+                     for i, angle, speed in zip(indices, targets[pose, indices].tolist(), speeds[pose, indices].tolist())])
+    return cmds
+
+
 if __name__ == '__main__':
 
     from Marionette import *
@@ -65,16 +117,16 @@ if __name__ == '__main__':
     # Define motion with all motors
     print "Full body motion"
 
-    target = [21, -980, 0, -2298, 0, 73, 355, 0, -1573, 0, -1919, 821]
-    speeds = [ 5,   15, 0,     5, 5, 10,   5, 5,     5, 5,     5,   5]
+    target = [21, -980, 0, -2298, 0, 73, 355, 0, -1573, 0, -1919, 821, 90, 90]
+    speeds = [ 5,   15, 0,     5, 5, 10,   5, 5,     5, 5,     5,   5, 32, 32]
     action = Action(target, 0.5)
 
     print "Commands to target:"
     for cmd in action.getCmdsToTarget(marionette.getAngles(), speeds):
         print ' '.join(map(str, cmd))
 
-    # Define motion of only 4 motors (S, SR, AR, WR)
-    # S, SR, SL, AR, AL, H, HR, HL, FR, FL, WR, WL
+    # Define motion of only 5 motors (S, SR, AR, WR, EX)
+    # S, SR, SL, AR, AL, H, HR, HL, FR, FL, WR, WL, EX, EY
     print " "
     print "Right arm only"
 
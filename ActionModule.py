@@ -17,6 +17,8 @@ import warnings
 import cv2
 
 import ArduinoCommunicator
+import MotorCommandScheduler
+import GestureTimeline
 import time
 import logging
 
@@ -34,6 +36,8 @@ TIME_TO_RESET = 30 # in seconds, how often the marionette should go to zero
 
 TIME_TO_RESET_HEAD_DATA = 15 # in seconds, reset the head data if nothing comes from the raspberry pi
 
+IO_WAIT_TIMEOUT = 0.5 # in seconds, longest time the arduino threads sleep when no command or data comes in
+
 class ActionModule(object):
 
     def __init__(self, cameraMaxX, cameraMaxY, dummy=False):
@@ -47,7 +51,9 @@ class ActionModule(object):
         self.isIdle = True
 
         self.headDataUpdated = False
-        
+        # set by the reader thread when the head data (roll, pitch, yaw) arrives
+        self.headDataEvent = threading.Event()
+
         self.tracking_disabled = False
 
         # TODO: hardcoded configs?
@@ -89,14 +95,26 @@ class ActionModule(object):
         self.timeInterval = 0.25 # (1/4 second)
 
         # Initialize the angles to the marionette's default (0 everywhere)
-        marionette = Marionette()
-        self.currentAngles = marionette.getAngles()
-        self.currentTargetAngles = marionette.getAngles()
+        marionette = getMarionetteModel()
+        self.currentAngles = marionette.getInitialAngles()
+        self.currentTargetAngles = marionette.getInitialAngles()
         self.targetReached = False
 
+        # Motor names, in the order of the angles
+        self.motorNames = list(marionette.motorNames)
+
+        # Compile the positions and the gestures once, moveTo and executeGesture only stream
+        # the compiled commands (see compilePosition and compileGesture)
+        self.compiledPositions = {}
+        for name in self.positions:
+            self.compilePosition(name)
+        self.compiledGestures = {}
+        for weight, sequence in self.gestureNameToSeq.values():
+            self.compileGesture(sequence)
+
         # Get min/max head angle values
-        self.headMinAngle = marionette.motor['H'].minAngle
-        self.headMaxAngle = marionette.motor['H'].maxAngle
+        self.headMinAngle = float(marionette.minAngles[marionette.motorIndex['motorH']])
+        self.headMaxAngle = float(marionette.maxAngles[marionette.motorIndex['motorH']])
 
         # Head IMU angles:
         self.roll = 0
@@ -164,10 +182,15 @@ class ActionModule(object):
 
         # Thread related variables
         self.movementCount = long(0)
-        self.busy_executing = False
-        self.qMotorCmds = Queue.PriorityQueue()
+        # runs the gestures and the IMU choreography (see GestureTimeline)
+        self.timeline = GestureTimeline.GestureTimeline()
+        self.gestureTimeline = None
+        # coalesces the tracking commands and keeps the gestures in order (see MotorCommandScheduler)
+        self.qMotorCmds = MotorCommandScheduler.MotorCommandScheduler()
         self.running = False
         self.arduino_thread = None
+        # reads the feedback of the arduino (see readerThreadFunc)
+        self.reader_thread = None
         self.start()
 
     def __del__(self):
@@ -177,25 +200,27 @@ class ActionModule(object):
     def stop(self):
         if self.running:
             self.running = False
+            self.timeline.stop()
             self.arduino_thread.join()
+            if self.reader_thread is not None:
+                self.reader_thread.join()
+                self.reader_thread = None
 
 
     def start(self):
         if not self.running:
             # Starts the thread
             self.running = True
+            self.timeline.start()
             self.arduino_thread = threading.Thread(name='Arduino', target=self.threadFunc, args=(self.dummy,))
             self.arduino_thread.setDaemon(True)
             self.arduino_thread.start()
 
 
     def clearQueue(self):
-        while not self.qMotorCmds.empty():
-            try:
-                self.qMotorCmds.get(False)
-            except Empty:
-                continue
-            self.qMotorCmds.task_done()
+        # the steps of the gestures would queue new commands
+        self.timeline.cancelAll()
+        self.qMotorCmds.clear()
 
 
     def getMovementCount(self):
@@ -207,116 +232,173 @@ class ActionModule(object):
             print "Dummy Arduino thread started."
             while(self.running):
                 self.isIdle = True
-                if not self.qMotorCmds.empty():
-                    self.isIdle = False
-                    cmds = self.qMotorCmds.get()
-                    #This line of code unwraps the actual command from its priority, since we're now using a PriorityQueue
-                    cmds = cmds[1]
-                    for cmd in cmds:
-                        id = self.arduinoID[cmd[0]]
-                        angle = int(cmd[1])
-                        speed = int(cmd[2])
-                        #print "id:",id," angle:",angle," speed:",speed
-                    #time.sleep(1)
+                # Waits for a command (the timeout lets the thread notice stop)
+                try:
+                    cmds = self.qMotorCmds.get(True, IO_WAIT_TIMEOUT)
+                except Queue.Empty:
+                    continue
+                self.isIdle = False
+                #This line of code unwraps the actual command from its priority, (see MotorCommandScheduler)
+                cmds = cmds[1]
+                for cmd in cmds:
+                    if cmd[0] == 'requestHeadData':
+                        # No head data without the arduino, answer right away
+                        self.headDataUpdated = True
+                        self.headDataEvent.set()
+                        continue
+                    if cmd[0] == 'IMU':
+                        continue
+                    id = self.arduinoID[cmd[0]]
+                    angle = int(cmd[1])
+                    speed = int(cmd[2])
+                    #print "id:",id," angle:",angle," speed:",speed
             print "Dummy Arduino thread stopped."
         else:
 
             print "Arduino thread started."
             self.ac = ArduinoCommunicator.ArduinoCommunicator("/dev/ttyUSB0")
-            self.last_time_target_reached = time.time()
-            
-	    # initialize the timer to now
-	    self.last_time_going_to_zero = time.time()
+
+            # The feedback is read in its own thread, this one only sends the commands
+            self.reader_thread = threading.Thread(name='ArduinoReader', target=self.readerThreadFunc)
+            self.reader_thread.setDaemon(True)
+            self.reader_thread.start()
+
+            # initialize the timer to now
+            self.last_time_going_to_zero = time.time()
 
             while(self.running):
-                if self.qMotorCmds.empty():
+                # Waits for a command (the timeout lets the thread notice stop)
+                try:
+                    cmds = self.qMotorCmds.get(True, IO_WAIT_TIMEOUT)
+                except Queue.Empty:
                     # check if the marionette should go to zero
                     if time.time() - self.last_time_going_to_zero > TIME_TO_RESET:
                         #self.goBackToZero()
                         self.last_time_going_to_zero = time.time()
-                else:
-                    self.isIdle = False
-                    cmds = self.qMotorCmds.get()
-                    #This line of code unwraps the actual command from its priority, since we're now using a PriorityQueue
-                    cmds = cmds[1]
-
-                    eyeMotion = False
-                    # Sets the eye angles to the current value
-                    eyeAngleX = self.currentAngles[12]
-                    eyeAngleY = self.currentAngles[13]
-                    eyeSpeedX = 0
-                    eyeSpeedY = 0
-                    self.targetReached = False
-                    #print(str(time.time()) + " sending command: " + str(cmds))
-                    for cmd in cmds:
-                        # print "step = ", step
-                        if cmd[0] == 'requestHeadData':
-                            logging.info(str(time.time()) + " EXE_R:.")
-                            self.ac.requestHeadData()
-                        elif cmd[0] == 'IMU':
-                            on = bool(cmd[1])
-                            logging.info(str(time.time()) + " EXE_I:" + str(on))
-                            if on:
-                                self.ac.engageIMU()
-                            else:
-                                self.ac.disengageIMU()
-                        else:
-                            # Motor command
-                            id = self.arduinoID[cmd[0]]
-                            angle = int(cmd[1])
-                            speed = int(cmd[2])
-                            if angle is None or speed == 0:
-                                # No motion
-                                continue
-                            if id == -1:
-                                # Obsolete motor AR
-                                continue
-                            if id == 'head':
-                                logging.info(str(time.time()) + " EXE_H:" + str(angle) + "," + str(speed))
-                                self.ac.rotateHead(angle, speed)
-                            elif id == 'shoulder':
-                                logging.info(str(time.time()) + " EXE_S:" + str(angle) + "," + str(speed))
-                                self.ac.rotateShoulder(angle, speed)
-                            elif id == 'eyeX':
-                                logging.info(str(time.time()) + " EXE_EX:" + str(angle) + "," + str(speed))
-                                eyeMotion = True
-                                eyeAngleX = angle
-                                eyeSpeedX = speed
-                            elif id == 'eyeY':
-                                logging.info(str(time.time()) + " EXE_EY:" + str(angle) + "," + str(speed))
-                                eyeMotion = True
-                                eyeAngleY = angle
-                                eyeSpeedY = speed
-                            else:
-                                # Other motors
-                                logging.info(str(time.time()) + " EXE_O:" + str(id) + "," + str(angle) + "," + str(speed))
-                                self.ac.rotateStringMotor(id, angle, speed)
-
-                    if eyeMotion:
-                        self.ac.rotateEyes(eyeAngleX, eyeAngleY, eyeSpeedX, eyeSpeedY)
-
-                # Read from the arduino
-                receivedData = self.ac.receive()
-                if receivedData != '':
-                    #print "received data: ", receivedData
-                    self.updateAnglesFromFeedback(receivedData)
-
-		# print info when the marionette did not reached target for a long time
-		if time.time() - self.last_time_target_reached > 10:
-		    print "currentAngles = ", self.currentAngles
-		    print "targetAngles = ", self.currentTargetAngles
-		    self.last_time_target_reached = time.time()
-		
-                # Check for target reached:
-                if self.checkTargetReached():
-		    self.last_time_target_reached = time.time()
-                    self.targetReached = True
-                    self.isIdle = True
-                    #print "Target reached!!!!! \n"
+                    continue
+
+                self.isIdle = False
+                #This line of code unwraps the actual command from its priority, (see MotorCommandScheduler)
+                self.sendCommands(cmds[1])
 
             print "Arduino thread stopped."
 
 
+    def readerThreadFunc(self):
+        """
+        Reads the feedback of the arduino as soon as it arrives (all the available lines at
+        once) and updates the current angles and the head data.
+        """
+        print "Arduino reader thread started."
+        self.last_time_target_reached = time.time()
+
+        while(self.running):
+            # Sleeps until the arduino sends something
+            self.ac.waitForData(IO_WAIT_TIMEOUT)
+
+            # Read everything the arduino sent (text lines or binary frames)
+            for cmd, values in self.ac.receiveMessages():
+                #print "received data: ", cmd, values
+                self.updateAnglesFromMessage(cmd, values)
+
+            # print info when the marionette did not reached target for a long time
+            if time.time() - self.last_time_target_reached > 10:
+                print "currentAngles = ", self.currentAngles
+                print "targetAngles = ", self.currentTargetAngles
+                self.last_time_target_reached = time.time()
+
+            # Check for target reached:
+            if self.checkTargetReached():
+                self.last_time_target_reached = time.time()
+                self.targetReached = True
+                self.isIdle = True
+                #print "Target reached!!!!! \n"
+
+        print "Arduino reader thread stopped."
+
+
+    def queueCommands(self, priority, cmds):
+        """
+        Queues motor commands for the arduino thread.
+
+        Args:
+            priority (int): 0 for tracking (eyes, head, IMU...), 1 for gestures.
+                Only the latest pending tracking command of each motor is sent.
+            cmds (list): list of commands, like [['motorH', angle, speed], ['IMU', 1]].
+        """
+        #This wraps the actual command in a tuple, the first element of which is the priority, which is another tuple of
+        #  the form (priority,movementCount). The second element is the actual output.
+        self.qMotorCmds.put(((priority, self.getMovementCount()), cmds))
+
+
+    def sendCommands(self, cmds):
+        """
+        Sends a list of commands to the arduino.
+
+        Args:
+            cmds (list): list of commands, like [['motorH', angle, speed], ['IMU', 1]].
+        """
+        eyeMotion = False
+        # Sets the eye angles to the current value
+        eyeAngleX = self.currentAngles[12]
+        eyeAngleY = self.currentAngles[13]
+        eyeSpeedX = 0
+        eyeSpeedY = 0
+        self.targetReached = False
+        #print(str(time.time()) + " sending command: " + str(cmds))
+        # Writes all the commands at once
+        self.ac.startBurst()
+        try:
+            for cmd in cmds:
+                # print "step = ", step
+                if cmd[0] == 'requestHeadData':
+                    logging.info(str(time.time()) + " EXE_R:.")
+                    self.ac.requestHeadData()
+                elif cmd[0] == 'IMU':
+                    on = bool(cmd[1])
+                    logging.info(str(time.time()) + " EXE_I:" + str(on))
+                    if on:
+                        self.ac.engageIMU()
+                    else:
+                        self.ac.disengageIMU()
+                else:
+                    # Motor command
+                    id = self.arduinoID[cmd[0]]
+                    angle = int(cmd[1])
+                    speed = int(cmd[2])
+                    if angle is None or speed == 0:
+                        # No motion
+                        continue
+                    if id == -1:
+                        # Obsolete motor AR
+                        continue
+                    if id == 'head':
+                        logging.info(str(time.time()) + " EXE_H:" + str(angle) + "," + str(speed))
+                        self.ac.rotateHead(angle, speed)
+                    elif id == 'shoulder':
+                        logging.info(str(time.time()) + " EXE_S:" + str(angle) + "," + str(speed))
+                        self.ac.rotateShoulder(angle, speed)
+                    elif id == 'eyeX':
+                        logging.info(str(time.time()) + " EXE_EX:" + str(angle) + "," + str(speed))
+                        eyeMotion = True
+                        eyeAngleX = angle
+                        eyeSpeedX = speed
+                    elif id == 'eyeY':
+                        logging.info(str(time.time()) + " EXE_EY:" + str(angle) + "," + str(speed))
+                        eyeMotion = True
+                        eyeAngleY = angle
+                        eyeSpeedY = speed
+                    else:
+                        # Other motors
+                        logging.info(str(time.time()) + " EXE_O:" + str(id) + "," + str(angle) + "," + str(speed))
+                        self.ac.rotateStringMotor(id, angle, speed)
+
+            if eyeMotion:
+                self.ac.rotateEyes(eyeAngleX, eyeAngleY, eyeSpeedX, eyeSpeedY)
+        finally:
+            self.ac.endBurst()
+
+
     def checkTargetReached(self):
         reached_target = True
         motors_to_ignore = [self.arduinoIDToAngleIndex['h'],
@@ -337,121 +419,165 @@ class ActionModule(object):
 
     def updateAnglesFromFeedback(self, receivedData):
         # Parse data: m,<id>,<angle>
-        id = -1
-        data = receivedData.split(",")
+        message = ArduinoCommunicator.parseFeedbackLine(receivedData)
         #print "Data received = ", receivedData
-        if data[0] == "m":
-            if len(data) == 3:
-                id = self.arduinoIDToAngleIndex[data[1]]
-                angle = int(data[2])
-                self.currentAngles[id] = angle
-        elif data[0] == "s" or data[0] == "h":
-            if len(data) == 2:
-                id = self.arduinoIDToAngleIndex[data[0]]
-                angle = int(data[1])
-                self.currentAngles[id] = angle
-        elif data[0] == "e":
-            if len(data) == 3:
-                id = self.arduinoIDToAngleIndex['e,x']
-                angle = int(data[1])
-                self.currentAngles[id] = angle
-                id = self.arduinoIDToAngleIndex['e,y']
-                angle = int(data[2])
-                self.currentAngles[id] = angle
-        elif data[0] == "a":
-            if len(data) == 4:
-                self.roll = int(data[1])
-                self.pitch = int(data[2])
-                self.yaw = int(data[3])
-                self.headDataUpdated = True
+        if message is not None:
+            self.updateAnglesFromMessage(message[0], message[1])
+
+
+    def updateAnglesFromMessage(self, cmd, values):
+        """
+        Updates the current angles or the head data from a feedback message of the arduino.
+
+        Args:
+            cmd (str): the message letter (m, s, h, e or a).
+            values (list): the int values of the message, like [id, angle] for m.
+        """
+        if len(values) != ArduinoCommunicator.FEEDBACK_LENGTHS.get(cmd):
+            return
+        if cmd == "m":
+            id = self.arduinoIDToAngleIndex.get(str(values[0]))
+            if id is not None:
+                self.currentAngles[id] = values[1]
+        elif cmd == "s" or cmd == "h":
+            id = self.arduinoIDToAngleIndex[cmd]
+            self.currentAngles[id] = values[0]
+        elif cmd == "e":
+            self.currentAngles[self.arduinoIDToAngleIndex['e,x']] = values[0]
+            self.currentAngles[self.arduinoIDToAngleIndex['e,y']] = values[1]
+        elif cmd == "a":
+            self.roll = values[0]
+            self.pitch = values[1]
+            self.yaw = values[2]
+            self.headDataUpdated = True
+            self.headDataEvent.set()
         #print "currentAngles = ", self.currentAngles
-	#print "targetAngles = ", self.currentTargetAngles
+        #print "targetAngles = ", self.currentTargetAngles
 
 
     def moveToAngles(self, target, speeds):
         action = Action(target, self.timeInterval)
         output = action.getCmdsToTarget(self.currentAngles, speeds)
         #print(output)
-        newTargetAngles = []
-        for oldAngle, newAngle in zip(self.currentTargetAngles, target):
-            if newAngle is None:
-                newTargetAngles.append(oldAngle)
-            else:
-                newTargetAngles.append(newAngle)
         # print "self.currentAngles = ", self.currentAngles
         # print "target = ", target
-        # print "newTargetAngles = ", newTargetAngles
-        self.currentTargetAngles = newTargetAngles
+        self.currentTargetAngles = mergeTargets(self.currentTargetAngles, action.target).tolist()
 
-        #This wraps the actual command in a tuple, the first element of which is the priority, which is another tuple of
-        #  the form (1,movementCount). The second element is the actual output. Eye and head movements are instead
-        #  inserted with priority (0,movementCount).  The tuple for priority is required because PriorityQueue does not
-        #  respect insertion order, just priority.  --Kaz.
-        self.qMotorCmds.put(((1,self.getMovementCount()),output))
+        # Gestures have priority 1, eye and head movements are instead inserted with priority 0
+        self.queueCommands(1, output)
+        return self.currentTargetAngles
+
+
+    def compilePosition(self, name):
+        """
+        Compiles a position into read-only (target angles, speeds) arrays, with NaN for the motors
+        it does not set (see Action.toAngleArray), used by moveToCompiled.
+        """
+        position = self.positions[name]
+        n = len(self.motorNames)
+        target = toAngleArray(position['angles'][:n])
+        speeds = np.array(position['speeds'][:n], dtype=float)
+        target.setflags(write=False)
+        speeds.setflags(write=False)
+        self.compiledPositions[name] = (target, speeds)
+
+
+    def moveToCompiled(self, compiledPosition, priority=1):
+        """
+        Same as moveToAngles for a position compiled by compilePosition.
+
+        Args:
+            compiledPosition (tuple): the compiled position.
+            priority (int): 1 for gestures, 0 for tracking.
+        """
+        target, speeds = compiledPosition
+        output = getCmdsToTargets(self.currentAngles, target, speeds)[0]
+        self.currentTargetAngles = mergeTargets(self.currentTargetAngles, target).tolist()
+
+        self.queueCommands(priority, output)
         return self.currentTargetAngles
 
 
     def moveTo(self, targetKey):
-        if targetKey not in self.positions.keys():
+        compiledPosition = self.compiledPositions.get(targetKey)
+        if compiledPosition is None:
             print "No targetKey = ", targetKey
             return None
 
-        position = self.positions[targetKey]
-        return self.moveToAngles(position['angles'], position['speeds'])
+        return self.moveToCompiled(compiledPosition)
+
 
-    def executeGesture(self, sequenceList, useThread=True):
+    def compileGesture(self, sequenceList):
+        """
+        Compiles a gesture (list of position names and delays) into the list of (time from the
+        start of the gesture, position name, compiled position or None if unknown) of its steps.
+        The compiled gestures are cached.
+        """
+        key = tuple(sequenceList)
+        compiledGesture = self.compiledGestures.get(key)
+        if compiledGesture is not None:
+            return compiledGesture
+
+        compiledGesture = []
+        stepTime = 0.0
+        for item in sequenceList:
+            try:
+                # if int -> wait
+                stepTime += float(item)
+            except:
+                # if str -> execute
+                if type(item) is tuple:
+                    raise ValueError('executeGesture should only execute gestures not tracking stuff')
+                if item not in self.positions:
+                    print "WARNING: gesture ", sequenceList, " uses unknown position ", item
+                compiledGesture.append((stepTime, item, self.compiledPositions.get(item)))
+        self.compiledGestures[key] = compiledGesture
+        return compiledGesture
+
+
+    @property
+    def busy_executing(self):
+        # True while a gesture is being executed
+        return self.timeline.isActive(self.gestureTimeline)
+
+    def executeGestureStep(self, targetKey, compiledPosition):
+        logging.info(str(time.time()) + " QUEUE_G:" + str(targetKey))
+        if compiledPosition is None:
+            print "No targetKey = ", targetKey
+            return
+        self.moveToCompiled(compiledPosition)
+
+    def executeGesture(self, sequenceList, useThread=True, preempt=False):
+        """
+        Executes a gesture: a list of position names and delays (in seconds) between them.
+
+        Args:
+            sequenceList (list): the gesture, like ['pos1', 0.5, 'pos2'].
+            useThread (bool): return right away instead of waiting for the end of the gesture.
+            preempt (bool): cancel the current gesture instead of ignoring this one.
+        """
         # check if we are currently executing a gesture
-        if self.busy_executing:
+        if self.busy_executing and not preempt:
             return
-        
-        self.busy_executing = True
-        # This function will be executed by a thread to execute a sequence
-        def executeSequence(seqList):
-            #print("executing: " + str(seqList))
-            for item in seqList:
-                try:
-                    # if int -> sleep
-                    delay = float(item)
-                    sleep(delay)
-                except:
-                    # if str -> execute
-                    if type(item) is tuple:
-                        raise ValueError('executeGesture should only execute gestures not tracking stuff')
-                    else:
-                        logging.info(str(time.time()) + " QUEUE_G:" + str(item))
-                        self.moveTo(item)
-            self.busy_executing = False
 
-        if useThread:
-            seqThread = Thread(target=executeSequence, args=[sequenceList])
-            seqThread.start()
-        else:
-            executeSequence(sequenceList)
-            self.busy_executing = False
+        # The steps of the gesture, timed from its start
+        steps = [(stepTime, self.executeGestureStep, [targetKey, compiledPosition])
+                 for stepTime, targetKey, compiledPosition in self.compileGesture(sequenceList)]
+
+        self.gestureTimeline = self.timeline.play(steps, MotorCommandScheduler.GESTURE_PRIORITY, preempt)
+        if not useThread:
+            self.timeline.wait(self.gestureTimeline)
 
     def executeLookAway(self, tracking_gesture):
         # this function is for responding to back camera movements
         # it is a kind of tracking function, but uses a defined gesture to do the tracking
         # 1. get the angle and speed
-        if tracking_gesture not in self.positions.keys():
+        compiledPosition = self.compiledPositions.get(tracking_gesture)
+        if compiledPosition is None:
             print "No targetKey = ", tracking_gesture
             return None
-        position = self.positions[tracking_gesture]
-        # 2. find the command
-        target = position['angles']
-        speeds = position['speeds']
-        action = Action(target, self.timeInterval)
-        output = action.getCmdsToTarget(self.currentAngles, speeds)
-        #print(output)
-        newTargetAngles = []
-        for oldAngle, newAngle in zip(self.currentTargetAngles, target):
-            if newAngle is None:
-                newTargetAngles.append(oldAngle)
-            else:
-                newTargetAngles.append(newAngle)
-        self.currentTargetAngles = newTargetAngles
-        # 3. send the command with high priority (like tracking)
-        self.qMotorCmds.put(((0,self.getMovementCount()),output))
+        # 2. find the command and 3. send it with high priority (like tracking)
+        self.moveToCompiled(compiledPosition, 0)
         
 
     def isMarionetteIdle(self):
@@ -503,7 +629,7 @@ class ActionModule(object):
         command = [['motorEX', eyeAngleX, speed], ['motorEY', eyeAngleY, speed]]
         #print(str(time.time()) + " putting the eye command in the queue")
         logging.info(str(time.time()) + " QUEUE_E:" + str(command))
-        self.qMotorCmds.put(((0,self.getMovementCount()), command))
+        self.queueCommands(0, command)
 
 
     def moveEyesAndHead(self, targetCameraCoords):
@@ -554,48 +680,33 @@ class ActionModule(object):
         # disable tracking until the set of commands involving the IMU is finished
         self.tracking_disabled = True
         
-        # create a thread to send items to queue in a timely manner
+        eyeCommand = [['motorEX', eyeAngleX, eye_speed], ['motorEY', eyeAngleY, eye_speed]]
 
-        def send_imu_messages(cmds):
-            
-            # send the eye command
-            command = [['motorEX', cmds[0], cmds[2]], ['motorEY', cmds[1], cmds[2]]]
+        def sendEyes():
             #print("sending the eye command")
-            logging.info(str(time.time()) + " QUEUE_IE:" + str(command))
-            self.qMotorCmds.put(((0,self.getMovementCount()), command))
-            
-            # wait for 200 ms
-            sleep(0.2)
-            
-            # engage IMU
+            logging.info(str(time.time()) + " QUEUE_IE:" + str(eyeCommand))
+            self.queueCommands(0, eyeCommand)
+
+        def engageIMU():
             logging.info(str(time.time()) + " QUEUE_I:" + str(headAngle))
             #print("sending the imu command")
-            self.qMotorCmds.put(((0,self.getMovementCount()), [['IMU' , 1]]))
-        
-            sleep(0.1)
-
-            #command = [['motorEX', 90, 90], ['motorEY', 90, 90]]
-            #print("reset the eye")
-            #logging.info(str(time.time()) + " QUEUE_IE:" + str(command))
-            #self.qMotorCmds.put(((0,self.getMovementCount()), command))
-            
-            #sleep(0.5)
+            self.queueCommands(0, [['IMU' , 1]])
 
-            # send the head command
+        def sendHead():
             #print("sending the head command")
-            self.qMotorCmds.put(((0,self.getMovementCount()), [['motorH', cmds[3], cmds[4]]]))
-            
-            # wait for 200 ms
-            sleep(0.5)
-            
-            # enable tracking
+            self.queueCommands(0, [['motorH', headAngle, head_speed]])
+
+        def enableTracking():
             self.tracking_disabled = False
-	    
-        # use a thread to send the IMU commands
-        #print("starting the imu thread")
-        imu_thread = Thread(target=send_imu_messages, args=[[eyeAngleX, eyeAngleY, eye_speed, headAngle, head_speed]])
-        imu_thread.start()
-        
+
+        # send the eye command, engage the IMU 200 ms later, send the head command 100 ms later
+        # and enable tracking 500 ms later (also if cancelled)
+        steps = [(0.0, sendEyes, []),
+                 (0.2, engageIMU, []),
+                 (0.3, sendHead, []),
+                 (0.8, enableTracking, [])]
+        self.timeline.play(steps, MotorCommandScheduler.TRACKING_PRIORITY, on_end=enableTracking)
+
 
     def eyeTargetToAngles(self, eyeToWorld, target):
         """Compute the eye angles (pitch and yaw) using the eye transform matrix
@@ -640,7 +751,7 @@ class ActionModule(object):
             raise InvalidSpeedsParameter
 
         # Check for overwrite and print overwritten angles inc ase we want to recover
-        if name in self.positions.keys():
+        if name in self.positions:
             print 'WARNING: Overwrite "', name, '" position (old values: ', self.positions[name], ').'
 
         # Add a position to the Position.json file
@@ -649,6 +760,9 @@ class ActionModule(object):
         position['speeds'] = speeds
         # print "position = ", position
         self.positions[name] = position
+        self.compilePosition(name)
+        # the compiled gestures hold the previous position
+        self.compiledGestures = {}
         with open("Positions.json", "w") as write_file:
             json.dump(self.positions, write_file, indent=4, sort_keys=True)
 
@@ -658,7 +772,7 @@ class ActionModule(object):
                 # print "Loading positions from ", filename, "..."
                 filePositions = json.load(read_file)
                 # print 'filePositions = ', filePositions.keys()
-                n = len(Marionette().motorList)
+                n = len(getMarionetteModel().motorNames)
                 updatedPositions = {}
                 for name in filePositions.keys():
                     # print "name = ", name
@@ -677,16 +791,14 @@ class ActionModule(object):
 
     def updateHeadData(self):
         self.headDataUpdated = False
+        self.headDataEvent.clear()
         #print(str(time.time()) + " putting a request for the head data in the queue")
         logging.info(str(time.time()) + " QUEUE_REQUEST_HEAD_DATA:.")
-        self.qMotorCmds.put(((0,self.getMovementCount()), [['requestHeadData']]))
-	    #self.ac.requestHeadData()
-        # Wait until head data is updated (bail if too long)
-        update_head_data_timer = time.time()
-        while not self.headDataUpdated:
-            if time.time() - update_head_data_timer > TIME_TO_RESET_HEAD_DATA:
-		self.headDataUpdated = True
-		print "WARNING ----- Head data requested were not updated"
+        self.queueCommands(0, [['requestHeadData']])
+        # Wait until head data is updated by the reader thread (bail if too long)
+        if not self.headDataEvent.wait(TIME_TO_RESET_HEAD_DATA):
+            self.headDataUpdated = True
+            print "WARNING ----- Head data requested were not updated"
 
 
     def saveCalibration(self, name):
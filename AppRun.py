@@ -0,0 +1,161 @@
+import time
+import sys
+
+import cv2
+
+import ArduinoCommunicator
+
+# maximum seconds to wait for the Raspberry Pi to boot
+RASPBERRY_PI_BOOT_TIMEOUT = 90
+
+from PyQt5.QtWidgets import *
+from PyQt5.QtCore import *
+from PyQt5.QtGui import *
+
+
+class AppRun(QWidget):
+
+    def __init__(self, realRun=None, testWithoutRasp=False):
+        super(AppRun, self).__init__()
+        self.setWindowTitle('Cat\'s Cradle')
+        self.move(0, 0)
+        self.realRun = realRun
+        self.testWithoutRasp = testWithoutRasp
+
+        self.loadingDialog = None
+
+        closeBtn = QPushButton('Stop CatsCradle')
+        closeBtn.clicked.connect(self.initShutdown)
+        layout = QGridLayout(self)
+        layout.addWidget(closeBtn, 1, 1)
+
+        self.setupStep = 0
+
+    def closeEvent(self, event):
+        self.initShutdown()
+        event.accept() # let the window close
+
+    def setup(self):
+        # Raise message boxes to make sure the user properly sets the marionette
+        # before running the AI
+        setupDialog = QMessageBox()
+        setupDialog.setText("Cat's Cradle Setup")
+        setupDialog.setStandardButtons(QMessageBox.Ok | QMessageBox.Close)
+        setupDialog.setDefaultButton(QMessageBox.Ok)
+
+        setupDialog.setInformativeText("Power on Raspberry Pi\n");
+        ret = setupDialog.exec_();
+        if ret == QMessageBox.Close:
+            return False
+
+        if not self.testWithoutRasp:
+            # Wait for the Raspberry Pi to answer (at most timeout seconds)
+            timeout = RASPBERRY_PI_BOOT_TIMEOUT
+            if "--testUI" in sys.argv:
+                timeout = 5
+            progress = QProgressDialog("Starting Raspberry Pi...", "Cancel", 0, timeout)
+            progress.setWindowModality(Qt.WindowModal)
+
+            def reportProgress(elapsed):
+                progress.setValue(min(int(elapsed), timeout))
+                return not progress.wasCanceled()
+
+            # Try port connection and warn user if failed
+            self.ac = ArduinoCommunicator.connect("/dev/ttyUSB0", timeout, reportProgress)
+            progress.setValue(timeout);
+            if progress.wasCanceled():
+                return False
+            if self.ac.serial_port is None:
+                errorDialog = QMessageBox()
+                errorDialog.setText("ERROR")
+                errorDialog.setIcon(QMessageBox.Critical)
+                errorDialog.setInformativeText("Port not found.\nMake sure the Raspberry Pi is connected to the right port\n")
+                errorDialog.setStandardButtons(QMessageBox.Ok)
+                errorDialog.setDefaultButton(QMessageBox.Ok)
+                errorDialog.exec_()
+                if not "--testUI" in sys.argv:
+                    return False
+            elif not self.ac.ready:
+                print "WARNING ----- The Raspberry Pi did not answer in " + str(timeout) + " seconds"
+                errorDialog = QMessageBox()
+                errorDialog.setText("ERROR")
+                errorDialog.setIcon(QMessageBox.Critical)
+                errorDialog.setInformativeText("The Raspberry Pi did not answer.\nMake sure it is powered on and started\n")
+                errorDialog.setStandardButtons(QMessageBox.Ok)
+                errorDialog.setDefaultButton(QMessageBox.Ok)
+                errorDialog.exec_()
+                if not "--testUI" in sys.argv:
+                    return False
+
+        self.setupStep = 1
+
+        setupDialog.setInformativeText("If necessary, plug main camera into battery\n");
+        ret = setupDialog.exec_();
+        if ret == QMessageBox.Close:
+            return False
+
+        self.setupStep = 2
+
+        setupDialog.setInformativeText("Power on motors and rear camera\n");
+        ret = setupDialog.exec_();
+        if ret == QMessageBox.Close:
+            return False
+
+        self.setupStep = 3
+
+        return True
+
+
+    def initShutdown(self):
+        if self.realRun:
+            self.realRun.stop()
+
+
+    def shutdown(self):
+        # Raise message boxes to make sure the user properly shuts down the marionette
+        shutdownDialog = QMessageBox()
+        shutdownDialog.setText("Cat's Cradle Shutdown")
+        shutdownDialog.setStandardButtons(QMessageBox.Ok)
+        shutdownDialog.setDefaultButton(QMessageBox.Ok)
+
+        if self.setupStep > 2:
+            shutdownDialog.setInformativeText("Turn Off Motors\n")
+            shutdownDialog.exec_()
+
+        if self.setupStep > 0:
+            shutdownDialog.setInformativeText("Turn Off Rasberry Pi\n")
+            shutdownDialog.exec_()
+
+    def checkCameras(self, frontCameraPort, backCameraPort):
+        # load the cameras
+        front_camera = cv2.VideoCapture(frontCameraPort)
+        back_camera = cv2.VideoCapture(backCameraPort)
+
+        # test cameras and warn user if one is missing
+        retFont, frame = front_camera.read()
+        retBack, frame = back_camera.read()
+
+        # release the cameras
+        if front_camera:
+            front_camera.release()
+        if back_camera:
+            back_camera.release()
+
+        msg = ""
+        result = True
+        if not retFont:
+            msg = "The front camera is not connected. The application will not be launched."
+            result = False
+        elif not retBack:
+            msg = "The back camera is not connected. The application will be launched without the back camera."
+
+        if msg is not "":
+            cameraDialog = QMessageBox()
+            cameraDialog.setText("ERROR")
+            cameraDialog.setStandardButtons(QMessageBox.Ok)
+            cameraDialog.setDefaultButton(QMessageBox.Ok)
+
+            cameraDialog.setInformativeText(msg)
+            cameraDialog.exec_()
+
+        return result
@@ -1,11 +1,178 @@
+import os
 import serial
 import random
+import select
 import struct
+import threading
 import time
 
+# seconds to wait for the first answer of the Raspberry Pi once the port is open (at most the
+# 2 seconds the communicator used to sleep before being used)
+READY_TIMEOUT = 2.0
+# seconds between two pings while waiting for the Raspberry Pi
+READY_PING_INTERVAL = 1.0
+# seconds between two checks of the existence of the port
+PORT_POLL_INTERVAL = 0.5
+
+# send the commands and read the feedback as binary frames instead of text lines
+# (only for a firmware that understands them, see encodeFrame)
+USE_BINARY_PROTOCOL = False
+# first byte of every binary frame
+FRAME_SYNC = 0xAA
+# number of values of each feedback message: m,<id>,<angle> s,<angle> h,<angle> e,<x>,<y> a,<roll>,<pitch>,<yaw>
+FEEDBACK_LENGTHS = {'m': 2, 's': 1, 'h': 1, 'e': 2, 'a': 3}
+
+
+def waitForPort(port, timeout, progress=None):
+    """
+    Waits until the serial port exists (the Raspberry Pi creates it when it boots).
+
+    Args:
+        port (str): path of the port.
+        timeout (float): maximum seconds to wait.
+        progress (function): called with the seconds elapsed while waiting. Returns False to cancel.
+
+    Returns:
+        True if the port exists.
+    """
+    start_time = time.time()
+    while not os.path.exists(port):
+        elapsed = time.time() - start_time
+        if elapsed > timeout:
+            return False
+        if progress is not None and progress(elapsed) is False:
+            return False
+        time.sleep(PORT_POLL_INTERVAL)
+    return True
+
+
+def connect(port, timeout, progress=None):
+    """
+    Waits for the Raspberry Pi to boot: waits for its port to exist, then for it to answer.
+    Replaces waiting a fixed time before using the marionette.
+
+    Args:
+        port (str): path of the port.
+        timeout (float): maximum seconds to wait in total.
+        progress (function): called with the seconds elapsed while waiting. Returns False to cancel.
+
+    Returns:
+        an ArduinoCommunicator. Its serial_port is None if the port never appeared, and ready is
+        False if the Raspberry Pi did not answer in time.
+    """
+    start_time = time.time()
+    if not waitForPort(port, timeout, progress):
+        return ArduinoCommunicator()
+
+    def remaining_progress(elapsed):
+        if progress is None:
+            return True
+        return progress(time.time() - start_time)
+
+    remaining = max(0.0, timeout - (time.time() - start_time))
+    return ArduinoCommunicator(port, remaining, remaining_progress)
+
+
+def frameChecksum(data):
+    """The checksum of a binary frame: the sum of its length, command and payload bytes, modulo 256."""
+    return sum(bytearray(data)) & 0xFF
+
+
+def encodeFrame(cmd, values):
+    """
+    Encodes a binary frame: [SYNC][LEN][CMD][values as big-endian int16...][CHK], where LEN is the
+    number of bytes of CMD and the values, and CHK is frameChecksum of LEN, CMD and the values.
+
+    The commands use the letters of the text protocol:
+        h (angle, speed), s (angle, speed), m (id, angle, speed), e (angleX, angleY, speedX, speedY),
+        i (on) for the IMU and r () to request the head data.
+
+    Args:
+        cmd (str): the command letter.
+        values (list): the integer values of the command.
+
+    Returns:
+        the frame (str).
+    """
+    body = struct.pack('>c%dh' % len(values), cmd, *values)
+    header = chr(len(body))
+    return chr(FRAME_SYNC) + header + body + chr(frameChecksum(header + body))
+
+
+def parseFeedbackLine(line):
+    """
+    Parses a line of feedback of the text protocol, such as 'm,<id>,<angle>'.
+
+    Args:
+        line (str): the line received.
+
+    Returns:
+        (command letter, list of int values), or None if the line is not valid.
+    """
+    data = line.strip().strip('\x00').split(",")
+    try:
+        return data[0], [int(value) for value in data[1:]]
+    except ValueError:
+        return None
+
+
+class FrameParser(object):
+    """
+    Decodes the binary frames of encodeFrame from a stream of bytes. Incomplete frames are kept
+    until the rest arrives, and invalid bytes are skipped until the next sync byte.
+    """
+    def __init__(self):
+        self.buffer = bytearray()
+        # decoded (command letter, list of int values), see pop
+        self.messages = []
+        self.invalid_frames = 0
+
+    def feed(self, data):
+        """Adds received bytes and decodes the complete frames."""
+        self.buffer.extend(data)
+        while True:
+            start = self.buffer.find(chr(FRAME_SYNC))
+            if start < 0:
+                del self.buffer[:]
+                return
+            del self.buffer[:start]
+            if len(self.buffer) < 2:
+                return
+            length = self.buffer[1]
+            if length < 1 or (length - 1) % 2 != 0:
+                # not a frame, look for the next sync byte
+                self.invalid_frames += 1
+                del self.buffer[:1]
+                continue
+            if len(self.buffer) < length + 3:
+                return
+            if frameChecksum(self.buffer[1:length + 2]) != self.buffer[length + 2]:
+                self.invalid_frames += 1
+                del self.buffer[:1]
+                continue
+            cmd = chr(self.buffer[2])
+            values = list(struct.unpack('>%dh' % ((length - 1) // 2), bytes(self.buffer[3:length + 2])))
+            self.messages.append((cmd, values))
+            del self.buffer[:length + 3]
+
+    def pop(self):
+        """Returns the messages decoded since the last call."""
+        messages = self.messages
+        self.messages = []
+        return messages
+
+
 class ArduinoCommunicator(object):
-    def __init__(self, port = ""):
+    def __init__(self, port = "", ready_timeout = READY_TIMEOUT, progress = None, binary = USE_BINARY_PROTOCOL):
         self.serial_port = None
+        # binary frames (see encodeFrame) or text lines
+        self.binary = binary
+        self.parser = FrameParser()
+        # data sent between startBurst and endBurst, written at once
+        self.burst = None
+        # held during a burst and each write, so that the commands of other threads are neither
+        # added to the burst nor written in the middle of it
+        self._write_lock = threading.RLock()
         if not port == "":
             try:
                 self.serial_port = serial.Serial(port, 115200, timeout = 1.0)
@@ -14,6 +181,9 @@ class ArduinoCommunicator(object):
 
         print "Using port : ", self.serial_port
 
+        # lines received while waiting for the Raspberry Pi, returned first by receive
+        self.pending_lines = []
+
         self.servo_min = -50
         self.servo_max = 50
         self.head_angle_max = 1000
@@ -30,8 +200,8 @@ class ArduinoCommunicator(object):
             self.motor_cmd_dict[name] = 0
             self.motor_sign_dict[name] = self.motor_sign_list[i]
 
-        # Wait a bit for the arduino to get ready
-        time.sleep(2)
+        # Wait for the arduino to get ready (it answers once it is)
+        self.ready = self.waitReady(ready_timeout, progress)
 
     def __del__(self):
         if self.serial_port is not None:
@@ -41,11 +211,113 @@ class ArduinoCommunicator(object):
         # Makes sure the command sent ends with NULL
         data += '\x00'
         #print "Sending: ", data
-        if self.serial_port is not None:
+        self._write(data)
+
+    def sendFrame(self, cmd, values):
+        self._write(encodeFrame(cmd, values))
+
+    def _write(self, data):
+        if self.serial_port is None:
+            return
+        with self._write_lock:
+            if self.burst is not None:
+                self.burst.append(data)
+                return
             self.serial_port.write(data)
             self.serial_port.flush()
 
+    def startBurst(self):
+        """
+        Keeps the commands sent by this thread until endBurst, to write and flush them at once.
+        The commands sent by the other threads meanwhile wait for endBurst.
+        """
+        self._write_lock.acquire()
+        self.burst = []
+
+    def endBurst(self):
+        """Writes the commands sent since startBurst."""
+        try:
+            burst = self.burst
+            self.burst = None
+            if burst:
+                self._write(''.join(burst))
+        finally:
+            self._write_lock.release()
+
+    def waitReady(self, timeout = READY_TIMEOUT, progress = None):
+        """
+        Pings the Raspberry Pi (requests the head data) until it answers.
+
+        Args:
+            timeout (float): maximum seconds to wait.
+            progress (function): called with the seconds elapsed while waiting. Returns False to cancel.
+
+        Returns:
+            True if the Raspberry Pi answered.
+        """
+        if self.serial_port is None:
+            return False
+
+        start_time = time.time()
+        last_ping_time = 0
+        while time.time() - start_time < timeout:
+            if time.time() - last_ping_time > READY_PING_INTERVAL:
+                self.requestHeadData()
+                last_ping_time = time.time()
+            # waits at most until the next ping or the timeout (the read only waits for the
+            # port timeout once the answer started)
+            data = ''
+            remaining = timeout - (time.time() - start_time)
+            if self.waitForData(max(0.0, min(READY_PING_INTERVAL, remaining))):
+                if self.binary:
+                    data = self.serial_port.read(max(1, self.serial_port.in_waiting))
+                else:
+                    data = self.serial_port.readline()
+            if data != '':
+                if self.binary:
+                    self.parser.feed(data)
+                else:
+                    self.pending_lines.append(data)
+                print "Port ready after %.1f seconds" % (time.time() - start_time)
+                return True
+            if progress is not None and progress(time.time() - start_time) is False:
+                return False
+
+        print "WARNING ----- No answer on port", self.serial_port.port, "after", timeout, "seconds"
+        return False
+
+    def fileno(self):
+        """Returns the file descriptor of the serial port (to wait on it with select), or None."""
+        if self.serial_port is None:
+            return None
+        return self.serial_port.fileno()
+
+    def waitForData(self, timeout):
+        """
+        Blocks until data can be read from the Raspberry Pi.
+
+        Args:
+            timeout (float): maximum seconds to wait.
+
+        Returns:
+            True if data can be read with receive.
+        """
+        if len(self.pending_lines) > 0 or len(self.parser.messages) > 0:
+            return True
+        if self.serial_port is None:
+            time.sleep(timeout)
+            return False
+        if self.serial_port.in_waiting:
+            return True
+        try:
+            ready, _, _ = select.select([self.fileno()], [], [], timeout)
+        except (select.error, OSError, ValueError):
+            return False
+        return len(ready) > 0
+
     def receive(self):
+        if len(self.pending_lines) > 0:
+            return self.pending_lines.pop(0)
         data = ''
         if self.serial_port is not None:
             if self.serial_port.in_waiting:
@@ -53,6 +325,27 @@ class ArduinoCommunicator(object):
                #print "Receiving: " + data
         return data
 
+    def receiveMessages(self):
+        """
+        Reads all the feedback available, in either protocol.
+
+        Returns:
+            list of (command letter, list of int values), like ('m', [id, angle]).
+        """
+        if self.binary:
+            if self.serial_port is not None and self.serial_port.in_waiting:
+                self.parser.feed(self.serial_port.read(self.serial_port.in_waiting))
+            return self.parser.pop()
+
+        messages = []
+        data = self.receive()
+        while data != '':
+            message = parseFeedbackLine(data)
+            if message is not None:
+                messages.append(message)
+            data = self.receive()
+        return messages
+
     def _checkLookAtInput(self, angle):
         """
         Check if the look at input is in range defined by servo_max and servo_min
@@ -142,6 +435,9 @@ class ArduinoCommunicator(object):
         if not self._checkHeadAngleInput(angle):
             print "Error: Head angle {} is out of allowed range.".format(angle)
             return
+        if self.binary:
+            self.sendFrame('h', [angle, speed])
+            return
         cmd = 'h,' + str(angle) + ',' + str(speed)
         self.send(cmd)
         # self.send(struct.pack('>cbb', 'h', angle, speed))
@@ -150,29 +446,47 @@ class ArduinoCommunicator(object):
         if not self._checkShoulderAngleInput(angle):
             print "Error: Shoulder angle {} is out of allowed range.".format(angle)
             return
+        if self.binary:
+            self.sendFrame('s', [angle, speed])
+            return
         cmd = 's,' + str(angle) + ',' + str(speed)
         self.send(cmd)
         # self.send(struct.pack('>cbb', 's', angle, speed))
 
     def rotateStringMotor(self, id, angle, speed = 10):
+        if self.binary:
+            self.sendFrame('m', [id, angle, speed])
+            return
         cmd = 'm,' + str(id) + ',' + str(angle) + ',' + str(speed)
         self.send(cmd)
         # self.send(struct.pack('>cbb', 'm', id, angle, speed))
 
     def rotateEyes(self, angleX, angleY, speedX, speedY):
+        if self.binary:
+            self.sendFrame('e', [angleX, angleY, speedX, speedY])
+            return
         cmd = 'e,' + str(angleX) + ',' + str(angleY) + ',' + str(speedX) + ',' + str(speedY)
         self.send(cmd)
         # self.send(struct.pack('>cbb', 'e', angleX, angleY, speedX, speedY))
 
     def engageIMU(self):
+        if self.binary:
+            self.sendFrame('i', [1])
+            return
         cmd = 'r,i,1'
         self.send(cmd)
 
     def disengageIMU(self):
+        if self.binary:
+            self.sendFrame('i', [0])
+            return
         cmd = 'r,i,0'
         self.send(cmd)
 
     def requestHeadData(self):
+        if self.binary:
+            self.sendFrame('r', [])
+            return
         cmd = 'r,h'
         self.send(cmd)
 
@@ -172,7 +172,8 @@ if __name__ == '__main__':
     camera.set(cv2.CAP_PROP_FRAME_WIDTH, 1920)
     camera.set(cv2.CAP_PROP_FRAME_HEIGHT, 1080)
 
-    personSensor = PersonSensor()
+    # no Qt or plots in this test: the windows can be drawn in their own thread
+    personSensor = PersonSensor(display_in_thread=True)
     personSensor.load_camera(camera)
     personSensor.show = True
 
@@ -182,7 +183,7 @@ if __name__ == '__main__':
         audience.update()
         for person in audience.persons:
             print(person)
-        if cv2.waitKey(1) & 0xFF == ord('q'):
+        if ord('q') in personSensor.display_sink.keys():
             break
 
     cv2.destroyAllWindows()
@@ -0,0 +1,81 @@
+import threading
+import time
+
+from MotionDetector import MotionDetector
+
+# maximum number of back camera frames processed per second
+BACK_CAMERA_MAX_FPS = 15
+
+class BackCameraMonitor(object):
+    """
+    Class used to measure the motion behind the marionette in its own thread. The thread
+    reads the back camera at its own rate and publishes the latest motion sample
+    (left, right, timestamp), which the main loop can read without waiting.
+    """
+    def __init__(self, back_camera, max_fps=BACK_CAMERA_MAX_FPS):
+        self.back_camera = back_camera
+        self.max_fps = max_fps
+        self._motion_detector = MotionDetector()
+
+        # the latest motion sample and the motion mask it was computed from
+        self._lock = threading.Lock()
+        self._sample = (0, 0, 0)
+        self._mask = None
+        self._seq = 0
+
+        # Thread related variables
+        self.running = False
+        self.monitor_thread = None
+        self.start()
+
+
+    def start(self):
+        if not self.running:
+            self.running = True
+            self.monitor_thread = threading.Thread(name='BackCameraMonitor', target=self.threadFunc)
+            self.monitor_thread.setDaemon(True)
+            self.monitor_thread.start()
+
+
+    def stop(self):
+        if self.running:
+            self.running = False
+            self.monitor_thread.join()
+
+
+    def threadFunc(self):
+        while self.running:
+            start_time = time.time()
+
+            # read a frame from the back camera (this waits for the camera)
+            ret, frame = self.back_camera.read()
+            if frame is None:
+                time.sleep(1.0 / self.max_fps)
+                continue
+
+            # get the difference between the current frame and the last frame
+            left, right = self._motion_detector.update(frame)
+            mask = self._motion_detector.mask.copy()
+            with self._lock:
+                self._sample = (left, right, time.time())
+                self._mask = mask
+                self._seq = self._seq + 1
+
+            # do not go faster than max_fps
+            remaining = 1.0 / self.max_fps - (time.time() - start_time)
+            if remaining > 0:
+                time.sleep(remaining)
+
+
+    def latest(self):
+        """
+        Get the latest motion sample.
+
+        Returns:
+            seq (int): the number of samples published so far (0 if none yet).
+            sample (tuple): (left, right, timestamp) motion amounts of the latest frame.
+            mask (np.array): the motion mask of the latest frame, or None if none yet.
+        """
+
+        with self._lock:
+            return self._seq, self._sample, self._mask
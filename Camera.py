@@ -1,5 +1,6 @@
 import cv2
 import threading
+import time
 import Queue
 
 # TODO: Add video file input option
@@ -79,6 +80,98 @@ class Camera:
         return self.scale * size / standardSize
 
 
+class LatestFrameCapture:
+    """
+    Class to read an opened cv2.VideoCapture in a thread, keeping only the latest frame.
+    Frames that are not read before the next one arrives are dropped (and counted), so the
+    reader always gets the newest frame without waiting for the camera.
+    """
+
+    def __init__(self, capture):
+        self.capture = capture
+        # the single frame slot and its sequence number and capture time
+        self.condition = threading.Condition()
+        self.frame = None
+        self.seq = 0
+        self.timestamp = 0
+        # the sequence number of the last frame given to the reader
+        self.last_read_seq = 0
+        # counters
+        self.frames_captured = 0
+        self.frames_dropped = 0
+        # Thread related variables
+        self.running = False
+        self.capture_thread = None
+        self.start()
+
+    def __del__(self):
+        self.stop()
+
+    def stop(self):
+        if self.running:
+            self.running = False
+            self.capture_thread.join()
+
+    def start(self):
+        if not self.running:
+            # Starts the thread
+            self.running = True
+            self.capture_thread = threading.Thread(name='LatestFrameCapture', target=self.threadFunc)
+            self.capture_thread.setDaemon(True)
+            self.capture_thread.start()
+
+    def threadFunc(self):
+        while(self.running):
+            retval, img = self.capture.read()
+            if not retval or img is None:
+                # camera not ready
+                time.sleep(0.01)
+                continue
+
+            with self.condition:
+                if self.seq > self.last_read_seq:
+                    # the previous frame was never read
+                    self.frames_dropped += 1
+                self.frame = img
+                self.seq += 1
+                self.timestamp = time.time()
+                self.frames_captured += 1
+                self.condition.notify_all()
+
+    def read_latest(self, timeout=0):
+        """
+        Get the latest frame if it was not read yet.
+
+        Args:
+            timeout (float): seconds to wait for a new frame.
+
+        Returns:
+            (frame, seq, timestamp) of the latest frame, or (None, seq, timestamp) of the last frame
+            read if no new frame arrived in time.
+        """
+        with self.condition:
+            if self.seq == self.last_read_seq and timeout > 0:
+                self.condition.wait(timeout)
+            if self.seq == self.last_read_seq:
+                return None, self.seq, self.timestamp
+            self.last_read_seq = self.seq
+            return self.frame, self.seq, self.timestamp
+
+    def read(self):
+        """Same as cv2.VideoCapture.read, but returns the latest frame (waits for the first one)."""
+        with self.condition:
+            while self.frame is None and self.running:
+                self.condition.wait(0.1)
+            self.last_read_seq = self.seq
+            return self.frame is not None, self.frame
+
+    def get(self, prop):
+        return self.capture.get(prop)
+
+    def set(self, prop, value):
+        return self.capture.set(prop, value)
+
+
 if __name__ == '__main__':
     # Tests
     c = Camera(0)
@@ -10,6 +10,9 @@ from SimulatorUI import *
 
 import ArduinoCommunicator
 
+# maximum seconds to wait for the Raspberry Pi to boot
+RASPBERRY_PI_BOOT_TIMEOUT = 90
+
 from PyQt5.QtWidgets import *
 from PyQt5.QtCore import *
 from PyQt5.QtGui import *
@@ -54,13 +57,27 @@ class MainApp(QWidget):
         if ret == QMessageBox.Close:
             return False
 
-        setupDialog.setInformativeText("Power on Raspberry Pi. Click Ok and wait 1 minute.\n");
+        setupDialog.setInformativeText("Power on Raspberry Pi. Click Ok and wait for it to start.\n");
         ret = setupDialog.exec_();
         if ret == QMessageBox.Close:
             return False
 
+        # Wait for the Raspberry Pi to answer (at most timeout seconds)
+        timeout = RASPBERRY_PI_BOOT_TIMEOUT
+        if "--testUI" in sys.argv:
+            timeout = 1
+        progress = QProgressDialog("Starting Raspberry Pi...", "Cancel", 0, timeout)
+        progress.setWindowModality(Qt.WindowModal)
+
+        def reportProgress(elapsed):
+            progress.setValue(min(int(elapsed), timeout))
+            return not progress.wasCanceled()
+
         # Try port connection and warn user if failed
-        ac = ArduinoCommunicator.ArduinoCommunicator("/dev/ttyUSB0")
+        ac = ArduinoCommunicator.connect("/dev/ttyUSB0", timeout, reportProgress)
+        progress.setValue(timeout);
+        if progress.wasCanceled():
+            return False
         if ac.serial_port is None:
             errorDialog = QMessageBox()
             errorDialog.setText("ERROR")
@@ -71,25 +88,19 @@ class MainApp(QWidget):
             errorDialog.exec_()
             if not "--testUI" in sys.argv:
                 return False
-
-        self.setupStep = 1
-
-        
-        # Wait for 60
-        delay = 60
-        if "--testUI" in sys.argv:
-            delay = 1
-        progress = QProgressDialog("Starting Raspberry Pi...", None, 0, delay)
-        progress.setWindowModality(Qt.WindowModal)
-
-        for i in range(0, delay):
-            progress.setValue(i)
-            if (progress.wasCanceled()):
+        elif not ac.ready:
+            print "WARNING ----- The Raspberry Pi did not answer in " + str(timeout) + " seconds"
+            errorDialog = QMessageBox()
+            errorDialog.setText("ERROR")
+            errorDialog.setIcon(QMessageBox.Critical)
+            errorDialog.setInformativeText("The Raspberry Pi did not answer.\nMake sure it is powered on and started\n")
+            errorDialog.setStandardButtons(QMessageBox.Ok)
+            errorDialog.setDefaultButton(QMessageBox.Ok)
+            errorDialog.exec_()
+            if not "--testUI" in sys.argv:
                 return False
-            time.sleep(1)
-
-        progress.setValue(delay);
 
+        self.setupStep = 1
 
         self.setupStep = 2
 
@@ -154,11 +165,7 @@ class MainApp(QWidget):
         # Return the marionette to resting position
         actionModule = ActionModule(10, 10, dummy=False)
         # Makes sure the current angles are not equal to the target (resting pause)
-        minAngles = []
-        marionette = Marionette()
-        for m in marionette.motorList:
-            minAngles.append(m.minAngle)
-        actionModule.currentAngles = minAngles
+        actionModule.currentAngles = getMarionetteModel().minAngles.tolist()
 
         # Go back to resting position
         actionModule.isIdle = False
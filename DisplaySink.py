@@ -0,0 +1,174 @@
+import threading
+import time
+
+from collections import deque
+
+import cv2
+
+# show the camera windows (set to False for headless runs)
+ENABLE_DISPLAY = True
+# render the windows in their own thread; if False, render must be called by the owner of the
+# windows (e.g. a Qt timer, see run.py). cv2 highgui must not run in another thread than the Qt
+# windows and matplotlib plots of the main thread: only render in a thread in runs without them
+# (e.g. scripts showing the cameras only)
+DISPLAY_IN_THREAD = False
+# maximum number of times per second the windows are redrawn
+DISPLAY_MAX_FPS = 15
+# keys pressed on the windows that are kept until read (see keys)
+KEY_HISTORY_LENGTH = 10
+
+OVERLAY_RECT_COLOR = (179, 178, 179)
+OVERLAY_LABEL_COLOR = (212, 211, 212)
+OVERLAY_TEXT_COLOR = (0, 0, 0)
+
+class DisplaySink(object):
+    """
+    Class used to show frames in cv2 windows without slowing down the sensing loop.
+
+    show only keeps the latest frame of each window (with its overlays) and returns
+    right away. The frames are resized to the window size, the overlays drawn and the
+    windows updated at most DISPLAY_MAX_FPS times per second, in render calls from the
+    main thread event loop, outside of the sensing code (or in a render thread if in_thread
+    is True, see DISPLAY_IN_THREAD). The windows are created once.
+    """
+    def __init__(self, enabled=ENABLE_DISPLAY, in_thread=DISPLAY_IN_THREAD, max_fps=DISPLAY_MAX_FPS):
+        self.enabled = enabled
+        self.in_thread = in_thread
+        self.max_fps = max_fps
+
+        # the latest frame of each window: window name -> (frame, overlays, window width)
+        self._pending = {}
+        self._condition = threading.Condition()
+        self._windows = set()
+        self._keys = deque(maxlen=KEY_HISTORY_LENGTH)
+        self._last_render_time = 0
+
+        # Thread related variables
+        self.running = False
+        self.render_thread = None
+        if self.enabled and self.in_thread:
+            self.start()
+
+
+    def start(self):
+        if not self.running:
+            self.running = True
+            self.render_thread = threading.Thread(name='DisplaySink', target=self.threadFunc)
+            self.render_thread.setDaemon(True)
+            self.render_thread.start()
+
+
+    def stop(self):
+        if self.running:
+            self.running = False
+            with self._condition:
+                self._condition.notify_all()
+            self.render_thread.join()
+
+
+    def show(self, window_name, frame, overlays=None, window_width=None):
+        """
+        Show a frame in a window (replaces the frame of the window waiting to be rendered).
+
+        Args:
+            window_name (str): the name of the window.
+            frame (np.array): cv2 frame. It is drawn on, so it should not be used by the caller anymore.
+            overlays (dict): what to draw on the frame, in frame coordinates:
+                {'text': text written at the top left, 'rects': list of (x, y, w, h, label or None)}.
+            window_width (int): the width of the window (the frame width if None).
+        """
+
+        if not self.enabled or frame is None:
+            return
+        with self._condition:
+            self._pending[window_name] = (frame, overlays, window_width)
+            self._condition.notify_all()
+
+
+    def keys(self):
+        """Returns the keys pressed on the windows since the last call (cv2.waitKey codes)."""
+        keys = []
+        while len(self._keys) > 0:
+            keys.append(self._keys.popleft())
+        return keys
+
+
+    def render(self):
+        """Draws the pending frames if they are due according to max_fps."""
+
+        if not self.enabled or time.time() - self._last_render_time < 1.0 / self.max_fps:
+            return
+        self._last_render_time = time.time()
+
+        with self._condition:
+            pending = self._pending
+            self._pending = {}
+
+        for window_name, (frame, overlays, window_width) in pending.items():
+            self._render_window(window_name, frame, overlays, window_width)
+
+        key = cv2.waitKey(1)
+        if key != -1:
+            self._keys.append(key & 0xFF)
+
+
+    def _render_window(self, window_name, frame, overlays, window_width):
+        height, width = frame.shape[:2]
+        if window_width is None:
+            window_width = width
+        window_height = int(float(height) / width * window_width)
+
+        # draw on the frame at the size of the window
+        scale = 1.0
+        if window_width < width:
+            scale = float(window_width) / width
+            frame = cv2.resize(frame, (window_width, window_height), interpolation=cv2.INTER_AREA)
+        if not overlays is None:
+            draw_overlays(frame, overlays, scale)
+
+        if not window_name in self._windows:
+            cv2.namedWindow(window_name, cv2.WINDOW_NORMAL)
+            cv2.resizeWindow(window_name, window_width, window_height)
+            self._windows.add(window_name)
+        cv2.imshow(window_name, frame)
+
+
+    def threadFunc(self):
+        while self.running:
+            with self._condition:
+                if len(self._pending) == 0:
+                    self._condition.wait(1.0 / self.max_fps)
+            self.render()
+            # do not go faster than max_fps
+            remaining = 1.0 / self.max_fps - (time.time() - self._last_render_time)
+            if remaining > 0:
+                time.sleep(remaining)
+
+        # the windows belong to this thread
+        cv2.destroyAllWindows()
+        self._windows = set()
+
+
+### Static methods
+
+def draw_overlays(frame, overlays, scale=1.0):
+    """
+    Draws the overlays of DisplaySink.show on a frame.
+
+    Args:
+        frame (np.array): cv2 frame.
+        overlays (dict): see DisplaySink.show.
+        scale (float): scale from the overlay coordinates to the frame.
+    """
+
+    if not overlays.get('text') is None:
+        cv2.putText(frame, overlays['text'], (10, 25), cv2.FONT_HERSHEY_DUPLEX, 1.0, OVERLAY_TEXT_COLOR, 1)
+
+    for x, y, w, h, label in overlays.get('rects', []):
+        x, y, w, h = int(x * scale), int(y * scale), int(w * scale), int(h * scale)
+        # draw rectangle on the frame
+        cv2.rectangle(frame, (x, y), (x + w, y + h), OVERLAY_RECT_COLOR, 2)
+        # draw a filled rectangle to write text
+        cv2.rectangle(frame, (x, y+h - 35), (x+w, y+h), OVERLAY_LABEL_COLOR, cv2.FILLED)
+        if not label is None:
+            cv2.putText(frame, label, (x+2, y+h-6), cv2.FONT_HERSHEY_DUPLEX, 1.0, OVERLAY_TEXT_COLOR, 1)
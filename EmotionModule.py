@@ -7,13 +7,11 @@
   - [Optional] May apply modifiers to parameters of all actions (i.e. sadness makes movements slower)
 """
 import numpy as np
-from mpl_toolkits.mplot3d import Axes3D
 import math
 import itertools
-import matplotlib
-matplotlib.use("QT5Agg")
-import matplotlib.pyplot as plt
-plt.ion()
+
+# matplotlib.pyplot, only loaded when the emotions are visualised (see load_pyplot)
+plt = None
 
 #The points in 3d space on the 3-simplex (i.e. form a tetrahedron) and thus represent the four emotions.
 simplex_points = np.asarray([[1, 0, 0],
@@ -24,6 +22,19 @@ EMOTION_LABELS = ["fear", "surprise", "longing", "shame"]
 
 EMOTION_DELTAS = {"small": 0.1, "medium": 0.2, "large": 0.3, "extreme": 0.4, "instant": 1}
 
+def load_pyplot():
+    '''Loads matplotlib with the Qt backend in interactive mode (only done once).'''
+    global plt
+    if plt is None:
+        import matplotlib
+        matplotlib.use("QT5Agg")
+        # registers the 3d projection
+        from mpl_toolkits.mplot3d import Axes3D
+        import matplotlib.pyplot as pyplot
+        pyplot.ion()
+        plt = pyplot
+    return plt
+
 def try_add(emotions,k,v):
     try:
         emotions[k] += v
@@ -56,6 +67,7 @@ class EmotionModule(object):
         self.visualise = visualise
         self.frameskip_count = 0
         if visualise:
+            load_pyplot()
             self.fig = plt.figure()
             self.ax = self.fig.add_subplot(111, projection='3d')
             xs, ys, zs = simplex_points.T
@@ -72,7 +84,8 @@ class EmotionModule(object):
             plt.show()
 
     def __del__(self):
-        plt.close()
+        if self.visualise:
+            plt.close()
 
     def update(self,audience, plot_frameskip = 3):
         self.velocity += self.acceleration
@@ -0,0 +1,95 @@
+import numpy as np
+
+# dimension of the face descriptors of dlib's recognition model
+DESCRIPTOR_SIZE = 128
+# if two face descriptors have a Euclidean distance less than this, they are from the same person
+FACE_MATCH_THRESHOLD = 0.6
+
+class FaceIndex(object):
+    """
+    Class used to find the known person of a face descriptor. The descriptors are kept in a
+    preallocated float32 matrix (one row per person) so that all the faces of a frame are
+    compared to all the known faces in one matrix product. When the index is full, the
+    person matched the longest time ago is forgotten.
+    """
+    def __init__(self, capacity, threshold=FACE_MATCH_THRESHOLD, descriptor_size=DESCRIPTOR_SIZE):
+        self.capacity = capacity
+        self.threshold = threshold
+
+        self._descriptors = np.zeros((capacity, descriptor_size), dtype=np.float32)
+        # squared norm of each row of _descriptors
+        self._squared_norms = np.zeros(capacity, dtype=np.float32)
+        self._persons = [None] * capacity
+        # the time (in number of calls to match) each row was last matched, for the eviction
+        self._last_used = np.zeros(capacity, dtype=np.int64)
+        self._clock = 0
+        self._size = 0
+
+
+    def __len__(self):
+        return self._size
+
+
+    def add(self, descriptor, person):
+        """
+        Add the descriptor of a new person (evicts the least recently matched person if the index is full).
+        """
+
+        if self._size < self.capacity:
+            row = self._size
+            self._size = self._size + 1
+        else:
+            row = int(np.argmin(self._last_used))
+
+        self._descriptors[row] = np.asarray(descriptor, dtype=np.float32)
+        self._squared_norms[row] = np.dot(self._descriptors[row], self._descriptors[row])
+        self._persons[row] = person
+        self._last_used[row] = self._clock
+
+
+    def distances(self, descriptors):
+        """
+        Returns the matrix of the Euclidean distances between the given descriptors (rows)
+        and the known descriptors (columns).
+        """
+
+        queries = np.asarray(descriptors, dtype=np.float32).reshape(len(descriptors), -1)
+        known = self._descriptors[:self._size]
+        # |q - k|^2 = |q|^2 + |k|^2 - 2 q.k
+        squared = (np.einsum('ij,ij->i', queries, queries)[:, np.newaxis]
+                   + self._squared_norms[np.newaxis, :self._size]
+                   - 2 * np.dot(queries, known.T))
+        return np.sqrt(np.maximum(squared, 0))
+
+
+    def match(self, descriptors):
+        """
+        Find the known person of each face of a frame. Faces are assigned to the nearest known
+        person closer than the threshold, and two faces can not be assigned to the same person
+        (the closest pairs are assigned first).
+
+        Args:
+            descriptors (list): the face descriptors of the faces of one frame.
+
+        Returns:
+            list with the Person of each descriptor, or None if the face is not known.
+        """
+
+        self._clock = self._clock + 1
+        persons = [None] * len(descriptors)
+        if len(descriptors) == 0 or self._size == 0:
+            return persons
+
+        distances = self.distances(descriptors)
+        face_indices, rows = np.nonzero(distances < self.threshold)
+        order = np.argsort(distances[face_indices, rows], kind='mergesort')
+
+        assigned_rows = set()
+        for i in order:
+            face_index, row = face_indices[i], rows[i]
+            if not persons[face_index] is None or row in assigned_rows:
+                continue
+            persons[face_index] = self._persons[row]
+            assigned_rows.add(row)
+            self._last_used[row] = self._clock
+        return persons
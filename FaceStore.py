@@ -0,0 +1,199 @@
+import os
+import threading
+import time
+import Queue
+
+import numpy as np
+
+from FaceIndex import DESCRIPTOR_SIZE
+
+MODULE_PATH = os.path.dirname(os.path.abspath(__file__))
+FACE_STORE_PATH = MODULE_PATH + '/face_store.dat'
+# number of persons the store can hold (the persons seen the longest time ago are replaced)
+FACE_STORE_CAPACITY = 500
+# persons not seen for this many seconds are forgotten
+FACE_STORE_MAX_AGE = 4 * 60 * 60
+# minimum seconds between two writes of the same person
+FACE_STORE_SAVE_INTERVAL = 5.0
+# seconds between two flushes of the store to the disk
+FACE_STORE_FLUSH_INTERVAL = 10.0
+
+# one record per person
+RECORD_DTYPE = np.dtype([('valid', np.uint8),
+                         ('person_id', np.int64),
+                         ('descriptor', np.float32, (DESCRIPTOR_SIZE,)),
+                         ('age_gender', np.float32, (4,)),
+                         ('has_age_gender', np.uint8),
+                         ('num_samples', np.int32),
+                         ('interestingness', np.float64),
+                         ('last_seen', np.float64)])
+
+class FaceStore(object):
+    """
+    Class used to remember the persons across restarts. The face descriptor, age/gender
+    probabilities, interestingness and last seen time of each person are kept in a
+    memory-mapped file.
+
+    The file is only touched by a background thread: it loads the stored persons once at
+    start (see get_loaded_records) and then writes the persons given to save, so the
+    per-frame code never waits on the disk.
+    """
+    def __init__(self, path=FACE_STORE_PATH, capacity=FACE_STORE_CAPACITY, max_age=FACE_STORE_MAX_AGE):
+        self.path = path
+        self.capacity = capacity
+        self.max_age = max_age
+
+        # rows and records loaded from the disk, waiting to be taken by get_loaded_records
+        self._loaded_records = None
+        self._loaded_lock = threading.Lock()
+
+        # snapshots of the persons to write
+        self._save_queue = Queue.Queue()
+        # last time each person was given to the writer (main thread side)
+        self._save_times = {}
+
+        # Thread related variables
+        self.running = False
+        self.store_thread = None
+        self.start()
+
+
+    def start(self):
+        if not self.running:
+            self.running = True
+            self.store_thread = threading.Thread(name='FaceStore', target=self.threadFunc)
+            self.store_thread.setDaemon(True)
+            self.store_thread.start()
+
+
+    def stop(self):
+        if self.running:
+            self.running = False
+            # wakes the thread up if it is waiting for persons to write
+            self._save_queue.put(None)
+            self.store_thread.join()
+
+
+    def get_loaded_records(self):
+        """
+        Get the persons loaded from the disk. Only returns them once, when the loading is done.
+
+        Returns:
+            rows (np.array): the row of each record in the store (see save).
+            records (np.array): the records (see RECORD_DTYPE).
+            or None if the loading is not done yet (or already taken).
+        """
+
+        with self._loaded_lock:
+            records = self._loaded_records
+            self._loaded_records = None
+        return records
+
+
+    def save(self, person, force=False, row=None):
+        """
+        Ask the background thread to write a person. Does nothing if the person was written less
+        than FACE_STORE_SAVE_INTERVAL seconds ago, unless force is True.
+
+        Args:
+            person (Person): the person to write.
+            force (bool): write the person even if it was written recently.
+            row (int): the row a loaded person was stored in (see get_loaded_records). The person
+                keeps that row under its new id instead of being stored twice.
+        """
+
+        if person.face_descriptor is None:
+            return
+        now = time.time()
+        if not force and now - self._save_times.get(person.id, 0) < FACE_STORE_SAVE_INTERVAL:
+            return
+        self._save_times[person.id] = now
+
+        probas = person.age_gender_probabilities
+        self._save_queue.put((person.id, row, np.array(person.face_descriptor, dtype=np.float32),
+                              None if probas is None else np.array(probas, dtype=np.float32),
+                              person.num_samples, person.interestingness, person.last_seen))
+
+
+    def _open(self):
+        """Opens the memory-mapped file (creates it if it does not exist or has another size)."""
+        size = self.capacity * RECORD_DTYPE.itemsize
+        mode = 'r+'
+        if not os.path.exists(self.path) or os.path.getsize(self.path) != size:
+            mode = 'w+'
+        return np.memmap(self.path, dtype=RECORD_DTYPE, mode=mode, shape=(self.capacity,))
+
+
+    def _expire(self, records):
+        expired = (records['valid'] == 1) & (time.time() - records['last_seen'] > self.max_age)
+        records['valid'][expired] = 0
+
+
+    def _write(self, records, rows, message):
+        person_id, loaded_row, descriptor, probas, num_samples, interestingness, last_seen = message
+        row = rows.get(person_id)
+        if row is None and not loaded_row is None and not loaded_row in rows.values():
+            # a loaded person -- keep its row (unless a person of this run took it meanwhile)
+            row = loaded_row
+            rows[person_id] = row
+        elif row is None:
+            free_rows = np.nonzero(records['valid'] == 0)[0]
+            if len(free_rows) > 0:
+                row = int(free_rows[0])
+            else:
+                # replace the person seen the longest time ago
+                row = int(np.argmin(records['last_seen']))
+            # the row may still belong to an expired or replaced person
+            previous_id = int(records['person_id'][row])
+            if rows.get(previous_id) == row:
+                del rows[previous_id]
+            rows[person_id] = row
+
+        records['person_id'][row] = person_id
+        records['descriptor'][row] = descriptor
+        if not probas is None:
+            records['age_gender'][row] = probas
+        records['has_age_gender'][row] = 0 if probas is None else 1
+        records['num_samples'][row] = num_samples
+        records['interestingness'][row] = interestingness
+        records['last_seen'][row] = last_seen
+        records['valid'][row] = 1
+
+
+    def threadFunc(self):
+        try:
+            records = self._open()
+        except (IOError, OSError, ValueError) as e:
+            print("Could not open the face store: " + str(e))
+            self.running = False
+            return
+
+        # load the stored persons (copied so that the main thread does not use the memory map)
+        self._expire(records)
+        loaded_rows = np.nonzero(records['valid'] == 1)[0]
+        with self._loaded_lock:
+            self._loaded_records = (loaded_rows, np.array(records[loaded_rows]))
+        # the stored persons get new ids when they are loaded: their rows stay valid until they
+        # are saved again under their new id (see save) or replaced once the store is full
+        rows = {}
+
+        last_flush_time = time.time()
+        while self.running:
+            try:
+                message = self._save_queue.get(True, FACE_STORE_FLUSH_INTERVAL)
+                if not message is None:
+                    self._write(records, rows, message)
+            except Queue.Empty:
+                pass
+
+            if time.time() - last_flush_time > FACE_STORE_FLUSH_INTERVAL:
+                self._expire(records)
+                records.flush()
+                last_flush_time = time.time()
+
+        # write the persons still waiting before the last flush
+        while not self._save_queue.empty():
+            message = self._save_queue.get()
+            if not message is None:
+                self._write(records, rows, message)
+        records.flush()
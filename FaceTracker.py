@@ -0,0 +1,59 @@
+import dlib
+
+# minimum peak to side lobe ratio of the correlation tracker to trust its position
+TRACKING_MIN_QUALITY = 7.0
+
+class FaceTracker(object):
+    """
+    Class used to follow the faces found by the prediction process from one camera frame
+    to the next, between two (slow) CNN detections. Each face is followed by a dlib
+    correlation tracker.
+    """
+    def __init__(self, min_quality=TRACKING_MIN_QUALITY):
+        self.min_quality = min_quality
+        # list of [person, tracker, lost]
+        self._tracks = []
+
+
+    def start(self, frame, persons, face_rects):
+        """
+        Start following the faces of a new detection (drops the previous tracks).
+
+        Args:
+            frame (np.array): the frame to start tracking from, in the same coordinates as face_rects.
+            persons (list): the Person objects of the detected faces.
+            face_rects (list): the dlib.rectangle of each face, in the same order as persons.
+        """
+
+        self._tracks = []
+        for person, face_rect in zip(persons, face_rects):
+            tracker = dlib.correlation_tracker()
+            tracker.start_track(frame, face_rect)
+            self._tracks.append([person, tracker, False])
+
+
+    def update(self, frame):
+        """
+        Follow the faces in a new frame.
+
+        Returns:
+            list of tuples (person, face_rect). face_rect is a dlib.drectangle, or None if
+            the face was lost since the last detection.
+        """
+
+        results = []
+        for track in self._tracks:
+            person, tracker, lost = track
+            if not lost:
+                quality = tracker.update(frame)
+                # once lost, the face is not followed until the next detection
+                track[2] = lost = quality < self.min_quality
+            if lost:
+                results.append((person, None))
+            else:
+                results.append((person, tracker.get_position()))
+        return results
+
+
+    def clear(self):
+        self._tracks = []
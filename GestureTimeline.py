@@ -0,0 +1,166 @@
+import heapq
+import threading
+import time
+import traceback
+
+class GestureTimeline(object):
+    """
+    Class used to run timed sequences of steps (gestures, eye/IMU/head choreography) in a single
+    thread instead of a thread per sequence sleeping between its steps.
+
+    The steps of all the sequences are kept in a heap ordered by deadline. The deadlines are computed
+    from the start of the sequence, so the delays of a sequence do not add up the time taken by
+    its steps. A sequence can be cancelled, or preempted by a sequence of higher priority (lower
+    value).
+    """
+    def __init__(self):
+        self._condition = threading.Condition()
+        # (deadline, priority, seq, timeline id, function, args)
+        self._heap = []
+        # active sequences: timeline id -> [priority, number of steps left, on_end]
+        self._timelines = {}
+        self._next_id = 0
+        self._seq = 0
+
+        # Thread related variables
+        self.running = False
+        self.timeline_thread = None
+        self.start()
+
+
+    def start(self):
+        if not self.running:
+            self.running = True
+            self.timeline_thread = threading.Thread(name='GestureTimeline', target=self.threadFunc)
+            self.timeline_thread.setDaemon(True)
+            self.timeline_thread.start()
+
+
+    def stop(self):
+        if self.running:
+            self.running = False
+            with self._condition:
+                self._condition.notify_all()
+            self.timeline_thread.join()
+
+
+    def play(self, steps, priority=0, preempt=False, on_end=None):
+        """
+        Schedules a sequence of steps.
+
+        Args:
+            steps (list): list of (seconds from now, function, args).
+            priority (int): steps due at the same time run by priority (lower value first).
+            preempt (bool): cancel the active sequences with the same or a lower priority (same or higher value).
+            on_end (function): called without arguments once the sequence is done or cancelled.
+
+        Returns:
+            the id of the sequence.
+        """
+        start_time = time.time()
+        with self._condition:
+            timeline_id = self._next_id
+            self._next_id += 1
+            ended = []
+            if preempt:
+                ended = self._cancel([id for id, timeline in self._timelines.items() if timeline[0] >= priority])
+            if len(steps) > 0:
+                self._timelines[timeline_id] = [priority, len(steps), on_end]
+                for delay, function, args in steps:
+                    self._seq += 1
+                    heapq.heappush(self._heap, (start_time + delay, priority, self._seq, timeline_id, function, args))
+            elif on_end is not None:
+                ended.append(on_end)
+            self._condition.notify_all()
+
+        for end in ended:
+            end()
+        return timeline_id
+
+
+    def cancel(self, timeline_id):
+        """Cancels the steps of a sequence that did not run yet."""
+        with self._condition:
+            ended = self._cancel([timeline_id])
+            self._condition.notify_all()
+        for end in ended:
+            end()
+
+
+    def cancelAll(self):
+        """Cancels all the sequences."""
+        with self._condition:
+            ended = self._cancel(self._timelines.keys())
+            self._condition.notify_all()
+        for end in ended:
+            end()
+
+
+    def _cancel(self, timeline_ids):
+        # returns the on_end functions to call (once the lock is released)
+        ended = []
+        for timeline_id in timeline_ids:
+            timeline = self._timelines.pop(timeline_id, None)
+            if timeline is not None and timeline[2] is not None:
+                ended.append(timeline[2])
+        if len(timeline_ids) > 0:
+            self._heap = [step for step in self._heap if step[3] in self._timelines]
+            heapq.heapify(self._heap)
+        return ended
+
+
+    def isActive(self, timeline_id):
+        """True if the sequence has steps left to run."""
+        with self._condition:
+            return timeline_id in self._timelines
+
+
+    def wait(self, timeline_id, timeout=None):
+        """
+        Waits for a sequence to be done or cancelled.
+
+        Returns:
+            True if it is, False if the timeout expired first.
+        """
+        end_time = None if timeout is None else time.time() + timeout
+        with self._condition:
+            while timeline_id in self._timelines:
+                if end_time is None:
+                    self._condition.wait()
+                else:
+                    remaining = end_time - time.time()
+                    if remaining <= 0:
+                        return False
+                    self._condition.wait(remaining)
+        return True
+
+
+    def threadFunc(self):
+        while self.running:
+            with self._condition:
+                if len(self._heap) == 0:
+                    self._condition.wait()
+                    continue
+                delay = self._heap[0][0] - time.time()
+                if delay > 0:
+                    self._condition.wait(delay)
+                    continue
+                deadline, priority, seq, timeline_id, function, args = heapq.heappop(self._heap)
+
+            try:
+                function(*args)
+            except Exception:
+                print "WARNING ----- Gesture step failed"
+                traceback.print_exc()
+
+            on_end = None
+            with self._condition:
+                timeline = self._timelines.get(timeline_id)
+                if timeline is not None:
+                    timeline[1] -= 1
+                    if timeline[1] == 0:
+                        del self._timelines[timeline_id]
+                        on_end = timeline[2]
+                        self._condition.notify_all()
+            if on_end is not None:
+                on_end()
@@ -3,6 +3,8 @@ from MatrixUtil import *
 from Motor import *
 from ReferenceSpace import *
 
+import threading
+
 #
 # Marionette's motors layout
 #      S = Shoulder rotation
@@ -24,6 +26,9 @@ from ReferenceSpace import *
 #
 #
 
+# Motors, in the order of the angles lists
+MOTOR_KEYS = ['S', 'SR', 'SL', 'AR', 'AL', 'H', 'HR', 'HL', 'FR', 'FL', 'WR', 'WL', 'EX', 'EY']
+
 class Marionette:
     """Hold the marionette physical data"""
 
@@ -101,7 +106,7 @@ class Marionette:
         self.motor = {}
         self.motorList = []
         self.stepperMotorList = []
-        for key in ['S', 'SR', 'SL', 'AR', 'AL', 'H', 'HR', 'HL', 'FR', 'FL', 'WR', 'WL', 'EX', 'EY']:
+        for key in MOTOR_KEYS:
             self.motor[key] = Motor('motor' + key, radius, self.motorMicrosteps[key], self.length[key])
             self.motorList.append(self.motor[key])
             if self.motor[key].isStatic:
@@ -439,6 +444,79 @@ class Marionette:
     #     return []
 
 
+class MarionetteModel(object):
+    """
+    Read-only description of the marionette (motor table, limits, max speeds and initial
+    transforms as flat arrays), built once and shared by the whole process: use
+    getMarionetteModel instead of building a Marionette when the current angles of its
+    motors are not needed. The Marionette class keeps the mutable state (for the simulator).
+    """
+    def __init__(self):
+        marionette = Marionette()
+        motors = marionette.motorList
+
+        self.motorKeys = tuple(MOTOR_KEYS)
+        self.motorNames = tuple(motor.name for motor in motors)
+        # motor name -> index in the angles lists (private: the motorIndex property returns a copy)
+        self._motorIndex = dict((motor.name, index) for index, motor in enumerate(motors))
+        # the angles the motors of a Marionette start at
+        self.initialAngles = tuple(marionette.getAngles())
+        self.minAngles = _readOnly(np.array([motor.minAngle for motor in motors], dtype=float))
+        self.maxAngles = _readOnly(np.array([motor.maxAngle for motor in motors], dtype=float))
+        self.maxSpeeds = _readOnly(np.array([motor.maxSpeed for motor in motors], dtype=float))
+        self.defaultAngles = _readOnly(np.array([motor.defaultAngle for motor in motors], dtype=float))
+        self.isStatic = _readOnly(np.array([motor.isStatic for motor in motors], dtype=bool))
+
+        # Initial transform of each motor to its parent reference space (index of the parent
+        # motor, or -1 for World)
+        parentIndex = []
+        initialTransforms = []
+        for motor in motors:
+            path = marionette.pathToWorld[motor]
+            parent = path[0] if len(path) > 0 else 'World'
+            parentIndex.append(-1 if parent == 'World' else self._motorIndex[parent.name])
+            initialTransforms.append(marionette.initialAToB[motor][parent])
+        self.parentIndex = _readOnly(np.array(parentIndex, dtype=int))
+        self.initialTransforms = _readOnly(np.array(initialTransforms, dtype=float))
+
+        self._frozen = True
+
+
+    def __setattr__(self, name, value):
+        if getattr(self, '_frozen', False):
+            raise AttributeError('MarionetteModel is read-only')
+        object.__setattr__(self, name, value)
+
+
+    @property
+    def motorIndex(self):
+        """Returns a new dict of motor name -> index in the angles lists."""
+        return dict(self._motorIndex)
+
+
+    def getInitialAngles(self):
+        """Returns a new list of the angles of a new Marionette (see Marionette.getAngles)."""
+        return list(self.initialAngles)
+
+
+def _readOnly(array):
+    array.setflags(write=False)
+    return array
+
+
+_marionetteModel = None
+_marionetteModelLock = threading.Lock()
+
+def getMarionetteModel():
+    """Returns the MarionetteModel shared by the process (built on the first call)."""
+    global _marionetteModel
+    if _marionetteModel is None:
+        with _marionetteModelLock:
+            if _marionetteModel is None:
+                _marionetteModel = MarionetteModel()
+    return _marionetteModel
+
+
 if __name__ == '__main__':
     # Tests
     np.set_printoptions(suppress=True, precision=2)
@@ -0,0 +1,148 @@
+import cv2
+import numpy as np
+
+# the frames are shrunk by this factor before computing the motion
+MOTION_DOWNSAMPLE = 2
+# size of the blur kernel on full size frames (scaled with MOTION_DOWNSAMPLE)
+MOTION_BLUR_SIZE = 9
+# minimum (blurred) color distance of a moving pixel on full size frames
+MOTION_THRESHOLD = 100
+# downsampling averages the pixels before the difference, which lowers the distances: the
+# thresholds of the downsampled frames that give the amounts of motion of MOTION_THRESHOLD on
+# full size frames, which ResponseModule.BACK_MOVEMENT_RESPONSE_MIN and
+# BACK_MOVEMENT_RESPONSE_FACTOR are tuned with (measured with test_motion_detector.py)
+DOWNSAMPLED_MOTION_THRESHOLDS = {2: 96, 4: 88}
+# optional grid of (rows, columns) zones to also measure the motion of (None to only measure
+# the left and right halves)
+MOTION_ZONES = None
+
+# sums the 3 channels of an image with cv2.transform
+SUM_CHANNELS = np.ones((1, 3), dtype=np.float32)
+
+class MotionDetector(object):
+    """
+    Class used to measure the amount of motion between consecutive camera frames, per zone.
+
+    This is adopted from here: https://software.intel.com/en-us/node/754940
+    A pixel is moving if the blurred color distance between the two frames is above the
+    threshold (see DOWNSAMPLED_MOTION_THRESHOLDS), and the amount of motion of a zone is the
+    standard deviation of the thresholded (0 or 255) image over the zone. The frames are
+    downsampled first and all the intermediate images are preallocated.
+    """
+    def __init__(self, downsample=MOTION_DOWNSAMPLE, zones=MOTION_ZONES, threshold=None):
+        self.downsample = downsample
+        self.zones = zones
+        if threshold is None:
+            threshold = DOWNSAMPLED_MOTION_THRESHOLDS.get(downsample, MOTION_THRESHOLD)
+        self.threshold = threshold
+
+        blur_size = max(1, int(round(MOTION_BLUR_SIZE / float(downsample))))
+        # the kernel size must be odd
+        self.blur_size = blur_size + 1 - blur_size % 2
+
+        # the shape of the camera frames the buffers were allocated for
+        self._frame_shape = None
+        # the two last downsampled frames
+        self._frames = None
+        self._current = 0
+        self._has_previous = False
+        # the amounts of motion of each zone of the grid, row by row (see update)
+        self.zone_motion = []
+
+
+    def _allocate(self, frame_shape):
+        height, width = frame_shape[:2]
+        size = (max(1, width // self.downsample), max(1, height // self.downsample))
+        channels = frame_shape[2] if len(frame_shape) > 2 else 1
+
+        self._frame_shape = frame_shape
+        self._size = size
+        self._frames = [np.zeros((size[1], size[0], channels), dtype=np.uint8) for i in range(2)]
+        self._diff = np.zeros((size[1], size[0], channels), dtype=np.uint8)
+        self._squared = np.zeros((size[1], size[0], channels), dtype=np.float32)
+        self._summed = np.zeros((size[1], size[0]), dtype=np.float32)
+        self._distance = np.zeros((size[1], size[0]), dtype=np.uint8)
+        self._blurred = np.zeros((size[1], size[0]), dtype=np.uint8)
+        self.mask = np.zeros((size[1], size[0]), dtype=np.uint8)
+        self._has_previous = False
+
+
+    def reset(self):
+        """Forget the previous frame."""
+        self._has_previous = False
+
+
+    def update(self, frame):
+        """
+        Measure the motion between the given frame and the previous one.
+
+        Args:
+            frame (np.array): cv2 frame (BGR or grayscale).
+
+        Returns:
+            the amounts of motion of the left and the right halves of the frame (0, 0 for the first frame).
+            If zones is set, the amounts of motion of the zones are in zone_motion.
+        """
+
+        if frame is None:
+            return 0, 0
+        if frame.shape != self._frame_shape:
+            self._allocate(frame.shape)
+
+        previous = self._frames[self._current]
+        self._current = 1 - self._current
+        current = self._frames[self._current]
+        cv2.resize(frame, self._size, current.reshape(current.shape[:frame.ndim]), interpolation=cv2.INTER_AREA)
+
+        if not self._has_previous:
+            self._has_previous = True
+            return 0, 0
+
+        # color distance between the two frames, scaled to 0..255 like
+        # sqrt(db^2 + dg^2 + dr^2) / sqrt(255^2 + 255^2 + 255^2) * 255
+        channels = current.shape[2]
+        cv2.absdiff(current, previous, self._diff)
+        cv2.multiply(self._diff, self._diff, self._squared, dtype=cv2.CV_32F)
+        if channels == 1:
+            self._summed[:] = self._squared[:, :, 0]
+        else:
+            cv2.transform(self._squared, SUM_CHANNELS[:, :channels], self._summed)
+        cv2.sqrt(self._summed, self._summed)
+        self._summed *= 1.0 / np.sqrt(channels)
+        # truncated like np.uint8 (convertScaleAbs would round)
+        np.copyto(self._distance, self._summed, casting='unsafe')
+
+        cv2.GaussianBlur(self._distance, (self.blur_size, self.blur_size), 0, self._blurred)
+        cv2.threshold(self._blurred, self.threshold, 255, cv2.THRESH_BINARY, self.mask)
+
+        if not self.zones is None:
+            self.zone_motion = zone_amounts(self.mask, self.zones)
+        left, right = zone_amounts(self.mask, (1, 2))
+        return left, right
+
+
+### Static methods
+
+def zone_amounts(mask, zones):
+    """
+    The standard deviation of each zone of a thresholded image. Since the image only has
+    0 and 255 values, the standard deviation is sqrt(mean * (255 - mean)).
+
+    Args:
+        mask (np.array): the thresholded image.
+        zones (tuple): (rows, columns) of the grid of zones.
+
+    Returns:
+        list of the standard deviation of each zone, row by row.
+    """
+
+    height, width = mask.shape[:2]
+    rows, columns = zones
+    amounts = []
+    for row in range(rows):
+        top, bottom = height * row // rows, height * (row + 1) // rows
+        for column in range(columns):
+            left, right = width * column // columns, width * (column + 1) // columns
+            mean = cv2.mean(mask[top:bottom, left:right])[0]
+            amounts.append(np.sqrt(max(0.0, mean * (255 - mean))))
+    return amounts
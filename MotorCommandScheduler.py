@@ -0,0 +1,123 @@
+import Queue
+import threading
+
+from collections import deque, OrderedDict
+
+# priority of the tracking commands (eyes, head, IMU...), only the latest command of each motor is kept
+TRACKING_PRIORITY = 0
+# priority of the gestures, sent in order
+GESTURE_PRIORITY = 1
+# commands that are not motor commands: they are never merged, the commands queued before them
+# are sent before them and the ones queued after them are sent after them
+BARRIER_COMMANDS = ('IMU', 'requestHeadData')
+
+class MotorCommandScheduler(object):
+    """
+    Class used to queue the motor commands for the arduino thread (replaces a PriorityQueue of
+    ((priority, count), cmds) with the same put/get interface).
+
+    Tracking commands are coalesced: a new target for a motor replaces the pending target of that
+    motor, so that the eyes go to the current face instead of replaying the previous ones. The
+    pending tracking commands are sent as one list, together with the next gesture if it moves other
+    motors. Gestures are never coalesced and keep their order, and the IMU and head data requests
+    keep their order relative to the tracking commands.
+    """
+    def __init__(self):
+        self._condition = threading.Condition()
+        # tracking commands: list of segments, each one an OrderedDict motor name -> command, or a
+        # barrier command
+        self._tracking = []
+        self._tracking_count = None
+        # gestures: deque of (count, cmds)
+        self._gestures = deque()
+        # number of tracking commands replaced by a newer one before being sent
+        self.coalesced = 0
+
+
+    def put(self, item):
+        """
+        Queues commands.
+
+        Args:
+            item (tuple): ((priority, count), cmds) where cmds is a list of commands like ['motorEX', angle, speed].
+        """
+        (priority, count), cmds = item
+        with self._condition:
+            if priority == TRACKING_PRIORITY:
+                for cmd in cmds:
+                    self._putTracking(cmd)
+                if self._tracking_count is None:
+                    self._tracking_count = count
+            else:
+                self._gestures.append((count, cmds))
+            self._condition.notify()
+
+
+    def _putTracking(self, cmd):
+        if cmd[0] in BARRIER_COMMANDS:
+            self._tracking.append(cmd)
+            return
+        if len(self._tracking) == 0 or not isinstance(self._tracking[-1], OrderedDict):
+            self._tracking.append(OrderedDict())
+        segment = self._tracking[-1]
+        if cmd[0] in segment:
+            self.coalesced += 1
+            del segment[cmd[0]]
+        segment[cmd[0]] = cmd
+
+
+    def get(self, block=True, timeout=None):
+        """
+        Gets the next commands to send.
+
+        Args:
+            block (bool): wait for commands if there are none.
+            timeout (float): maximum seconds to wait (None to wait forever).
+
+        Returns:
+            ((priority, count), cmds), like a PriorityQueue item.
+
+        Raises:
+            Queue.Empty if there are no commands.
+        """
+        with self._condition:
+            if block and self._empty():
+                self._condition.wait(timeout)
+            if self._empty():
+                raise Queue.Empty
+
+            if len(self._tracking) == 0:
+                return (GESTURE_PRIORITY, self._gestures[0][0]), self._gestures.popleft()[1]
+
+            count = self._tracking_count
+            segment = self._tracking.pop(0)
+            if len(self._tracking) == 0:
+                self._tracking_count = None
+            if not isinstance(segment, OrderedDict):
+                return (TRACKING_PRIORITY, count), [segment]
+
+            cmds = segment.values()
+            # send the next gesture in the same burst if it does not move the same motors
+            if len(self._tracking) == 0 and len(self._gestures) > 0:
+                gesture = self._gestures[0][1]
+                if all(cmd[0] not in segment and cmd[0] not in BARRIER_COMMANDS for cmd in gesture):
+                    self._gestures.popleft()
+                    cmds = cmds + gesture
+            return (TRACKING_PRIORITY, count), cmds
+
+
+    def _empty(self):
+        return len(self._tracking) == 0 and len(self._gestures) == 0
+
+
+    def empty(self):
+        with self._condition:
+            return self._empty()
+
+
+    def clear(self):
+        """Drops all the pending commands."""
+        with self._condition:
+            self._tracking = []
+            self._tracking_count = None
+            self._gestures.clear()
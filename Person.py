@@ -46,11 +46,18 @@ class Person:
         self.last_seen = time.time()
         
         # Person's properties
-        self.age_gender_probabilities = age_gender_probas
-        self.set_age_gender_from_probas()
+        # age_gender_probas can be None when age/gender was not predicted for the face
+        self.age_gender_probabilities = None
+        self.gender = '?'
+        self.ageRange = '?'
         
         # number of samples (frames) that the age/gender are being predicted based on
-        self.num_samples = 1
+        self.num_samples = 0
+        self.update_age_gender(age_gender_probas)
+
+        # the last face descriptor of the person and the number of times in a row it was reused
+        self.face_descriptor = None
+        self.descriptor_reuse_count = 0
 
         self.speed = 0
         # Height is a value proportional to the person's size on screen
@@ -86,7 +93,14 @@ class Person:
 
 
     def update_age_gender(self, age_gender_probas):
-        if self.num_samples >= MAX_NUM_SAMPLES:
+        if age_gender_probas is None or self.num_samples >= MAX_NUM_SAMPLES:
+            return
+
+        if self.age_gender_probabilities is None:
+            # first sample
+            self.age_gender_probabilities = np.array(age_gender_probas, dtype=float)
+            self.set_age_gender_from_probas()
+            self.num_samples = 1
             return
         
         # update the new probas and prediction
@@ -98,6 +112,11 @@ class Person:
         self.num_samples = self.num_samples + 1
         
     
+    def age_gender_saturated(self):
+        """Returns True if the age/gender does not change with new samples anymore."""
+        return self.num_samples >= MAX_NUM_SAMPLES
+
+
     def set_age_gender_from_probas(self):
         index = np.argmax(self.age_gender_probabilities)
         if index == 0:
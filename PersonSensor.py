@@ -1,11 +1,13 @@
 
 import cv2
 from image_processing import predictor
+from image_processing.frame_ring import FrameRing
+from image_processing.predictor_pool import PredictorPool
+import imutils
 from imutils.face_utils import rect_to_bb
 import numpy as np
 
-from multiprocessing import Process, Queue
-from collections import deque
+from collections import deque, OrderedDict
 
 from datetime import datetime
 
@@ -14,60 +16,134 @@ import time
 import logging
 
 import Person
+from FaceTracker import FaceTracker
+from FaceIndex import FaceIndex
+from FaceStore import FaceStore
+from BackCameraMonitor import BackCameraMonitor
+from Camera import LatestFrameCapture
+from DisplaySink import DisplaySink, ENABLE_DISPLAY, DISPLAY_IN_THREAD
 
 QUEUE_MAX_MESSAGES = 10
+# number of prediction processes (each one loads its own models)
+PREDICTOR_WORKERS = 2
+# frames waiting for each prediction process
+WORKER_QUEUE_MAX_MESSAGES = max(1, QUEUE_MAX_MESSAGES // PREDICTOR_WORKERS)
+# more slots than queued messages so that a frame is never overwritten while it is
+# waiting in a queue or in the batch a prediction process dequeued (see predictor.MAX_BATCH_SIZE)
+FRAME_RING_SLOTS = PREDICTOR_WORKERS * (WORKER_QUEUE_MAX_MESSAGES + predictor.MAX_BATCH_SIZE) + 1
+# send one frame out of FRAME_PROCESSING_STRIDE to the prediction process (see also request_detection)
 FRAME_PROCESSING_STRIDE = 1
 FACE_HISTORY_LENGTH = 100
 
+# resize frames to predictor.PROCESSING_SIZE before sending them to the prediction process
+PREPROCESS_ON_CAPTURE = True
+# also convert the frames to grayscale before sending them (the predictor rebuilds 3 channels
+# for the face descriptors, which costs some recognition accuracy)
+PREPROCESS_GRAYSCALE = False
+# tallest front camera frame expected (height / width), used to size the frame ring slots
+MAX_FRAME_ASPECT_RATIO = 0.75
+# largest front camera frame expected, sent as is if PREPROCESS_ON_CAPTURE is False
+MAX_CAMERA_FRAME_SHAPE = (1080, 1920, 3)
+
+# seconds to wait for a new front camera frame in each update (the front camera is read in its own thread)
+FRONT_CAMERA_TIMEOUT = 0.01
+# seconds between two logs of the front camera counters
+CAPTURE_STATS_LOG_INTERVAL = 60
+# seconds the latest back camera motion sample is returned for (the back camera stopped if no
+# newer sample came meanwhile)
+BACK_CAMERA_SAMPLE_MAX_AGE = 1.0
+
+# follow the detected faces on every camera frame between two detections
+ENABLE_FACE_TRACKING = True
+
+# the descriptor of a known face is reused (see predictor.ENABLE_DESCRIPTOR_REUSE) at most
+# DESCRIPTOR_MAX_REUSE times in a row, then it is computed again
+DESCRIPTOR_MAX_REUSE = 10
+# seconds between two logs of the counters of the prediction processes
+PREDICTION_STATS_LOG_INTERVAL = 60
+
+# remember the persons across restarts (see FaceStore)
+ENABLE_FACE_STORE = True
+
 class PersonSensor():
     """
     Class used to detect faces and bodies in front of the marionette and
     bodies behind the marionette.
     """
-    def __init__(self):
+    def __init__(self, display=True, display_in_thread=DISPLAY_IN_THREAD):
         
         # a public variable to reference the camera (later to load)
         self.front_camera = None
         self.back_camera = None
+        # reads the front camera in its own thread (see load_camera)
+        self._front_capture = None
+        # shows the camera windows (nothing is shown if display is False). The windows are rendered
+        # by display_sink.render calls from the event loop unless display_in_thread is True (see
+        # DISPLAY_IN_THREAD)
+        self.display_sink = DisplaySink(display and ENABLE_DISPLAY, display_in_thread)
+        self._last_capture_log_time = time.time()
         
-        # The means to transfer frames to the prediction process
-        self._frames_to_process_queue = Queue(QUEUE_MAX_MESSAGES)
-        # The means to transfer back prediction results from the prediction process
-        self._prediction_results_queue = Queue(QUEUE_MAX_MESSAGES)
+        # The shared memory the frames to process are written to
+        self._frame_ring = FrameRing(FRAME_RING_SLOTS, frame_slot_shape())
         
         # bookkeeping the frames to process
         self._frame_counter = 0
-        # bookkeeping the latest predictions
+        self._detection_requested = False
+        # bookkeeping the frames searched around the known faces only (see predictor.ENABLE_ROI_DETECTION)
+        self._roi_frame_counter = 0
+        # bookkeeping the latest predictions and the persons of each prediction
         self._latest_predictions = []
-        # bookkeeping the last camera frame
-        self._last_back_camera_frame = None
+        self._latest_persons = []
+        self._last_stats_log_time = time.time()
+        # scale factors (width, height) from the predictor's frames to the camera frames
+        self._frame_scale = (1.0, 1.0)
+        # measures the motion behind the marionette in its own thread (see load_camera)
+        self._back_camera_monitor = None
+        self._back_camera_seq = 0
     
-        # initialize the prediction process
-        self._prediction_process = Process(target=predictor.process_image,
-                                     args=(self._frames_to_process_queue, self._prediction_results_queue))
-        self._prediction_process.daemon = True
-        self._prediction_process.start()
+        # initialize the prediction processes
+        self._predictor_pool = PredictorPool(PREDICTOR_WORKERS, self._frame_ring, WORKER_QUEUE_MAX_MESSAGES)
     
         # history of face encodings.
-        self._face_encodings = deque(maxlen=FACE_HISTORY_LENGTH)
-        self._person_objects = deque(maxlen=FACE_HISTORY_LENGTH)
+        self._face_index = FaceIndex(FACE_HISTORY_LENGTH)
         self._last_id = 0
+        # the persons of the previous runs are loaded in the background
+        self._face_store = None
+        if ENABLE_FACE_STORE:
+            self._face_store = FaceStore()
+
+        # follows the faces between detections
+        self._face_tracker = FaceTracker()
+        # the frames sent to the prediction processes, by seq, to start tracking on the frame
+        # a detection was made on (see _restart_tracking)
+        self._detection_frames = OrderedDict()
+        # the latest processed frame, kept for the updates without a new camera frame
+        self._last_processed_frame = None
     
     
     # deconstructor
     def release(self):
-        self._frames_to_process_queue.close()
-        self._prediction_results_queue.close()
-        self._prediction_process.terminate()
+        self._predictor_pool.release()
+        if not self._front_capture is None:
+            self._front_capture.stop()
+        self.display_sink.stop()
+        if not self._back_camera_monitor is None:
+            self._back_camera_monitor.stop()
+        if not self._face_store is None:
+            self._face_store.stop()
     
 
     def load_camera(self, front_camera, back_camera):
         self.front_camera = front_camera
         self.back_camera = back_camera
     
+        if not front_camera is None:
+            self._front_capture = LatestFrameCapture(front_camera)
+
         if not back_camera is None:
             self.backCameraMaxX = self.back_camera.get(cv2.CAP_PROP_FRAME_WIDTH)
             self.backCameraMaxY = self.back_camera.get(cv2.CAP_PROP_FRAME_HEIGHT)
+            self._back_camera_monitor = BackCameraMonitor(back_camera)
     
 
     # the 'update' method
@@ -81,42 +157,272 @@ class PersonSensor():
         if self.front_camera is None:
             return previousPersons, previousPersonBodies
         
-        # read one frame from the camera
-        ret, frame = self.front_camera.read()
-        self._frame_counter = self._frame_counter + 1
-
-        if self._frame_counter == FRAME_PROCESSING_STRIDE:
-            # call to process the frame
-            try:
-                # put a message containing the frame to process for
-                self._frames_to_process_queue.put({'frame': frame, 'time': datetime.now()}, False)
-            except:
-                # if the queue is full continue
-                pass
+        # get the latest frame from the camera (None if there is no new frame yet)
+        frame, _, _ = self._front_capture.read_latest(FRONT_CAMERA_TIMEOUT)
+        if not frame is None:
+            self._frame_counter = self._frame_counter + 1
+        self._log_capture_stats()
+
+        # resize the frame once here rather than in the prediction process; the
+        # resized frame is also the one the faces are tracked on
+        processed_frame = None
+        if not frame is None and (PREPROCESS_ON_CAPTURE or ENABLE_FACE_TRACKING):
+            processed_frame, self._frame_scale = preprocess_frame(frame, PREPROCESS_GRAYSCALE)
+            self._last_processed_frame = processed_frame
+
+        if not frame is None and (self._frame_counter >= FRAME_PROCESSING_STRIDE or self._detection_requested):
+            # call to process the frame (if the queue is full drop the frame)
+            if not self._predictor_pool.full():
+                if PREPROCESS_ON_CAPTURE:
+                    frame_to_process = processed_frame
+                else:
+                    frame_to_process = frame
+                    self._frame_scale = processing_scale(frame)
+                # write the frame in shared memory and send its descriptor
+                descriptor = self._frame_ring.write(frame_to_process, datetime.now())
+                if not descriptor is None:
+                    descriptor.update(self._next_detection_area())
+                    descriptor['known_faces'] = self._known_faces()
+                    if self._predictor_pool.submit(descriptor):
+                        self._detection_requested = False
+                        if ENABLE_FACE_TRACKING:
+                            self._keep_detection_frame(descriptor['seq'], processed_frame)
             self._frame_counter = 0
 
-        # update prediction results for display (only if new results available)
-        new_results = False
-        try:
-            results = self._prediction_results_queue.get(False)
+        # add the persons of the previous runs once they are loaded
+        self._add_stored_persons()
+
+        # update the persons and the prediction results for display (only if new results available)
+        results_list = self._get_new_prediction_results()
+        if len(results_list) > 0:
+            # a batch of frames gives several results at once: update the persons with
+            # each of them in order and keep the persons of the most recent frame
+            for results in results_list:
+                persons = self._update_persons(results['predictions'])
+
             # prediction results is a list of tuples that each contains the following
-            # index 0. face_rect of a face in the last frame,
-            # index 1. face_descriptors of a face in the last frame,
-            # index 2. probabilities of age/gender in the last frame.
-            self._latest_predictions = results
-            new_results = True
-        except:
-            # no new results -- return early
-            new_results = False
+            # index 0. face_rect of a face in the frame,
+            # index 1. face_descriptors of a face in the frame,
+            # index 2. probabilities of age/gender of the person of the face (the probas of
+            #          the frame are None for the persons whose age/gender is saturated).
+            self._latest_predictions = [(prediction[0], prediction[1], person.age_gender_probabilities)
+                                        for prediction, person in zip(results_list[-1]['predictions'], persons)]
+            self._latest_persons = persons
+
+            # restart tracking from the new detections, even if there is no new camera frame
+            # in this update (the results would be lost on the next one otherwise)
+            if ENABLE_FACE_TRACKING:
+                self._restart_tracking(results_list[-1]['seq'], persons, self._last_processed_frame)
+        elif ENABLE_FACE_TRACKING and not processed_frame is None:
+            # no new results -- follow the faces of the last results in the new frame
+            self._track_persons(processed_frame)
 
         # display frame
         self.display_front_frame(frame, self._latest_predictions)
 
-        if not new_results:
+        if len(results_list) == 0:
+            # no new results -- return early
             return previousPersons, previousPersonBodies
+
+        self._log_prediction_stats()
+
+        personBodies = previousPersonBodies
         
+#        for person in persons:
+#            print(person)
+
+        return persons, personBodies
+
+
+    def request_detection(self):
+        """
+        Send the next camera frame to the prediction process even if it is not due
+        according to FRAME_PROCESSING_STRIDE.
+        """
+        self._detection_requested = True
+
+
+    def _next_detection_area(self):
+        """
+        Decides where the prediction process should search for faces in the next frame: only
+        around the last known faces, or in the whole frame once every
+        predictor.ROI_FULL_SWEEP_INTERVAL frames (with a cheaper upsample count) to find new faces.
+
+        Returns:
+            a dict with 'rois' and 'upsample' to add to the frame descriptor.
+        """
+
+        if not predictor.ENABLE_ROI_DETECTION or len(self._latest_predictions) == 0:
+            # nobody known -- search the whole frame
+            self._roi_frame_counter = 0
+            return {'rois': None, 'upsample': predictor.UPSAMPLE_COUNT}
+
+        self._roi_frame_counter = self._roi_frame_counter + 1
+        if self._roi_frame_counter >= predictor.ROI_FULL_SWEEP_INTERVAL:
+            self._roi_frame_counter = 0
+            return {'rois': None, 'upsample': predictor.FULL_SWEEP_UPSAMPLE_COUNT}
+
+        rois = [(face_rect.left(), face_rect.top(), face_rect.right(), face_rect.bottom())
+                for face_rect, _, _ in self._latest_predictions]
+        return {'rois': rois, 'upsample': predictor.UPSAMPLE_COUNT}
+
+
+    def _known_faces(self):
+        """
+        The faces of the last predictions, sent to the prediction process so that it can reuse their
+        descriptors and skip their age/gender prediction (see predictor.match_known_face).
+        """
+
+        known_faces = []
+        for (face_rect, _, _), person in zip(self._latest_predictions, self._latest_persons):
+            face_descriptor = person.face_descriptor
+            if person.descriptor_reuse_count >= DESCRIPTOR_MAX_REUSE:
+                # refresh the descriptor from time to time (the count is reset once it is
+                # computed again, see _update_persons)
+                face_descriptor = None
+            known_faces.append({'rect': (face_rect.left(), face_rect.top(), face_rect.right(), face_rect.bottom()),
+                                'descriptor': face_descriptor,
+                                'saturated': person.age_gender_saturated()})
+        return known_faces
+
+
+    def prediction_stats(self):
+        """Returns the counters of the work done and saved by the prediction processes (see predictor.new_stats)."""
+        return self._predictor_pool.stats()
+
+
+    def capture_stats(self):
+        """Returns the counters of the front camera: frames captured and frames dropped before being read."""
+        if self._front_capture is None:
+            return {'frames_captured': 0, 'frames_dropped': 0}
+        return {'frames_captured': self._front_capture.frames_captured,
+                'frames_dropped': self._front_capture.frames_dropped}
+
+
+    def _log_capture_stats(self):
+        if time.time() - self._last_capture_log_time < CAPTURE_STATS_LOG_INTERVAL:
+            return
+        self._last_capture_log_time = time.time()
+        logging.info(str(time.time()) + ' CAPTURE_STATS:' + str(self.capture_stats()))
+
+
+    def _log_prediction_stats(self):
+        if time.time() - self._last_stats_log_time < PREDICTION_STATS_LOG_INTERVAL:
+            return
+        self._last_stats_log_time = time.time()
+        logging.info(str(time.time()) + ' PREDICTION_STATS:' + str(self.prediction_stats()))
+
+
+    def _track_persons(self, processed_frame):
+        """
+        Update the faces of the persons of the last detection from the tracked face boxes.
+        Persons whose face was lost keep their last position until the next detection.
+        """
+
+        tracked_predictions = []
+        tracked_persons = []
+        for person, face_rect in self._face_tracker.update(processed_frame):
+            if face_rect is None:
+                continue
+            face_position = self.get2dAnd3dCoordsFromLocation(face_rect.top(), face_rect.right(),
+                                                              face_rect.bottom(), face_rect.left())
+            person.updateFace(face_position)
+            tracked_predictions.append((face_rect, None, person.age_gender_probabilities))
+            tracked_persons.append(person)
+
+        # display the tracked faces
+        self._latest_predictions = tracked_predictions
+        self._latest_persons = tracked_persons
+
+
+    def _keep_detection_frame(self, seq, processed_frame):
+        """Keep a frame sent to the prediction processes until its results arrive."""
+        self._detection_frames[seq] = processed_frame
+        # the frames whose results never came (skipped by the prediction processes)
+        while len(self._detection_frames) > FRAME_RING_SLOTS:
+            self._detection_frames.popitem(False)
+
+
+    def _restart_tracking(self, seq, persons, current_frame):
+        """
+        Start following the faces of a detection on the frame the detection was made on, then
+        follow them up to the current frame (the results arrive several frames later).
+
+        Args:
+            seq (int): the seq of the frame of the detection.
+            persons (list): the persons of the detection, in the order of self._latest_predictions.
+            current_frame (np.array): the latest processed frame, or None.
+        """
+
+        detection_frame = self._detection_frames.pop(seq, None)
+        # the frames of older detections are not needed anymore
+        for old_seq in [old_seq for old_seq in self._detection_frames if old_seq < seq]:
+            del self._detection_frames[old_seq]
+
+        if detection_frame is None:
+            detection_frame = current_frame
+        if detection_frame is None:
+            return
+
+        self._face_tracker.start(detection_frame, persons,
+                                 [prediction[0] for prediction in self._latest_predictions])
+        if not current_frame is None and not current_frame is detection_frame:
+            self._track_persons(current_frame)
+
+
+    def _get_new_prediction_results(self):
+        """
+        Get all the new prediction results, in the order the frames were sent.
+        """
+        return self._predictor_pool.get_results()
+
+
+    def _add_stored_persons(self):
+        """
+        Add the persons loaded by the face store to the history of faces. They get new ids since
+        ids are only unique within a run.
+        """
+
+        if self._face_store is None:
+            return
+        loaded = self._face_store.get_loaded_records()
+        if loaded is None:
+            return
+        rows, records = loaded
+
+        # the most recently seen persons last, so that they are the last ones evicted from the index
+        order = np.argsort(records['last_seen'], kind='mergesort')[-FACE_HISTORY_LENGTH:]
+        no_face_position = self.get2dAnd3dCoordsFromLocation(0, 0, 0, 0)
+        for row, record in zip(rows[order], records[order]):
+            person = Person.Person(None, self._last_id, no_face_position)
+            if record['has_age_gender']:
+                person.update_age_gender(record['age_gender'])
+                person.num_samples = int(record['num_samples'])
+            person.interestingness = float(record['interestingness'])
+            person.last_seen = float(record['last_seen'])
+            person.face_descriptor = np.array(record['descriptor'])
+            self._face_index.add(person.face_descriptor, person)
+            self._face_store.save(person, True, int(row))
+            self._last_id += 1
+
+
+    def _update_persons(self, predictions):
+        """
+        Match the faces of one frame with the history of faces.
+
+        Args:
+            predictions (list): a list of tuples (face_rect, face_descriptor, age_gender_probas),
+                one per face detected in the frame.
+
+        Returns:
+            list of Person objects in the frame.
+        """
+
+        # compare all the face encodings of the frame to the history of encodings at once
+        matched_persons = self._face_index.match([prediction[1] for prediction in predictions])
+
         persons = []
-        for prediction in self._latest_predictions:
+        for prediction, person in zip(predictions, matched_persons):
             # prediction is a tuple containing prediction info for ONE detected face
             face_rect = prediction[0]
             face_position = self.get2dAnd3dCoordsFromLocation(face_rect.top(), face_rect.right(),
@@ -124,66 +430,57 @@ class PersonSensor():
             face_encoding = prediction[1]
             age_gender_probas = prediction[2]
             
-            # compare the face encoding to the history of encodings
-            distances = np.array([100])
-            if len(self._face_encodings) > 0:
-                distances = np.linalg.norm(np.array(self._face_encodings) - np.array(face_encoding), axis=1, ord=2)
-            if True in (distances < 0.6):
+            if not person is None:
                 # found a match in history -- return the person object
-                person = self._person_objects[(distances < 0.6).argmax()]
                 person.reappear()
                 person.update_age_gender(age_gender_probas)
                 person.updateFace(face_position)
+                if not person.face_descriptor is None and np.array_equal(face_encoding, person.face_descriptor):
+                    # the prediction process reused the descriptor that was sent
+                    person.descriptor_reuse_count = person.descriptor_reuse_count + 1
+                else:
+                    person.descriptor_reuse_count = 0
+                person.face_descriptor = face_encoding
                 persons.append(person)
             else:
                 # new person
-                self._face_encodings.append(face_encoding)
                 person = Person.Person(age_gender_probas, self._last_id, face_position)
+                person.face_descriptor = face_encoding
                 persons.append(person)
-                self._person_objects.append(person)
+                self._face_index.add(face_encoding, person)
                 self._last_id += 1
-        
-        personBodies = previousPersonBodies
-        
-#        for person in persons:
-#            print(person)
 
-        return persons, personBodies
+            if not self._face_store is None:
+                self._face_store.save(person)
+
+        return persons
+
 
-    
     def update_back_camera(self):
+        """
+        Get the motion behind the marionette measured by the back camera thread. The latest
+        motion sample is returned until there is a new one (0, 0 if it is older than
+        BACK_CAMERA_SAMPLE_MAX_AGE).
+        This function should be called from the main thread since it displays the motion on a window.
+        """
+
         # return early if the camera is not setup
-        if self.back_camera is None:
+        if self._back_camera_monitor is None:
             return 0, 0
     
-        # read a frame from the back camera
-        ret, frame = self.back_camera.read()
-        
-        motion_amount_right = 0
-        motion_amount_left = 0
-        # if we have a previous frame calculate the motion
-        if not self._last_back_camera_frame is None:
-            # this code is adopted from here: https://software.intel.com/en-us/node/754940
-            # get the difference between the current frame and the last frame
-            dist = frame_distance(frame, self._last_back_camera_frame)
-            mod = cv2.GaussianBlur(dist, (9,9), 0)
-            _, threshold = cv2.threshold(mod, 100, 255, 0)
-            left_threshold = threshold[:,:int(self.backCameraMaxX/2)]
-            right_threshold = threshold[:,int(self.backCameraMaxX/2):]
-            
-            _, stdev_right = cv2.meanStdDev(right_threshold)
-            _, stdev_left = cv2.meanStdDev(left_threshold)
-            
-            motion_amount_right = stdev_right[0][0]
-            motion_amount_left = stdev_left[0][0]
-#            print(str(motion_amount_left) + ", " + str(motion_amount_right))
+        seq, (motion_amount_left, motion_amount_right, sample_time), mask = self._back_camera_monitor.latest()
+        if seq == 0 or time.time() - sample_time > BACK_CAMERA_SAMPLE_MAX_AGE:
+            # no recent sample
+            return 0, 0
+        if seq == self._back_camera_seq:
+            # no new sample -- the motion did not change since the last update
+            return motion_amount_left, motion_amount_right
+        self._back_camera_seq = seq
+#        print(str(motion_amount_left) + ", " + str(motion_amount_right))
 
-            # display
-            cv2.namedWindow('Back Camera -- Motion Detector', cv2.WINDOW_NORMAL)
-            cv2.resizeWindow('Back Camera -- Motion Detector', 400, int(0.56*400))
-            cv2.imshow('Back Camera -- Motion Detector', threshold)
+        # display
+        self.display_sink.show('Back Camera -- Motion Detector', mask, None, 400)
 
-        self._last_back_camera_frame = frame
 #        cv2.namedWindow('Back Camera', cv2.WINDOW_NORMAL)
 #        cv2.resizeWindow('Back Camera', 300, int(0.56*300))
 #        cv2.imshow('Back Camera', frame)
@@ -192,7 +489,7 @@ class PersonSensor():
     
     def display_front_frame(self, frame, prediction_results):
         """
-        Display frame on cv2 window.
+        Display frame on cv2 window (the drawing is done by the display sink).
         
         Args:
             frame (?): cv2 frame.
@@ -200,32 +497,26 @@ class PersonSensor():
                 a face and has (face_rect, age, gender).
         """
 
-        if frame is None:
+        if frame is None or not self.display_sink.enabled:
             return
         
-        height, width = frame.shape[:2]
-        img_ratio = float(height) / float(width)
-        w_scale_factor = float(width) / float(predictor.PROCESSING_SIZE)
-        h_scale_factor = float(height) / (predictor.PROCESSING_SIZE * img_ratio)
+        w_scale_factor, h_scale_factor = self._frame_scale
         
         # write the last person id
-        cv2.putText(frame, str(self._last_id) + ' - ' + str(len(prediction_results)), (10, 25), cv2.FONT_HERSHEY_DUPLEX, 1.0, (0, 0, 0), 1)
+        overlays = {'text': str(self._last_id) + ' - ' + str(len(prediction_results)), 'rects': []}
 
         if len(prediction_results) > 0:
             # write the results on the frame
             for face_rect, _, age_gender_probas in prediction_results:
                 # convert dlib.rectangle to regular bounding box
                 (x, y, w, h) = rect_to_bb(face_rect)
-                # re-scale based on predictor.PROCESSING_SIZE
+                # re-scale from the predictor's frame to the camera frame
                 x = int(x * w_scale_factor)
                 y = int(y * h_scale_factor)
                 w = int(w * w_scale_factor)
                 h = int(h * h_scale_factor)
-                # draw rectangle on the frame
-                cv2.rectangle(frame, (x, y), (x + w, y + h), (179, 178, 179), 2)
-                # draw a filled rectangle to write text
-                cv2.rectangle(frame, (x, y+h - 35), (x+w, y+h), (212, 211, 212), cv2.FILLED)
                 # write age and gender if provided
+                text = None
                 if not age_gender_probas is None:
                     index = np.argmax(age_gender_probas)
                     text = ''
@@ -239,12 +530,10 @@ class PersonSensor():
                         text = 'senior'
                     else:
                         print("Age / gender out of range.")
-                    cv2.putText(frame, text, (x+2, y+h-6), cv2.FONT_HERSHEY_DUPLEX, 1.0, (0, 0, 0), 1)
+                overlays['rects'].append((x, y, w, h, text))
 
         # display the frame
-        cv2.namedWindow('Front Camera', cv2.WINDOW_NORMAL)
-        cv2.resizeWindow('Front Camera', predictor.PROCESSING_SIZE, int(img_ratio*predictor.PROCESSING_SIZE))
-        cv2.imshow('Front Camera', frame)
+        self.display_sink.show('Front Camera', frame, overlays, predictor.PROCESSING_SIZE)
 
 
     def get2dAnd3dCoordsFromLocation(self, top, right, bottom, left):
@@ -260,11 +549,44 @@ class PersonSensor():
 
 ### Static methods
 
-def frame_distance(frame1, frame2):
-    """outputs pythagorean distance between two frames"""
-    frame1_32 = np.float32(frame1)
-    frame2_32 = np.float32(frame2)
-    diff32 = frame1_32 - frame2_32
-    norm32 = np.sqrt(diff32[:,:,0]**2 + diff32[:,:,1]**2 + diff32[:,:,2]**2)/np.sqrt(255**2 + 255**2 + 255**2)
-    dist = np.uint8(norm32*255)
-    return dist
+def frame_slot_shape():
+    """
+    The shape of the frame ring slots: the largest frame sent to the prediction processes, which
+    is a frame resized to predictor.PROCESSING_SIZE if PREPROCESS_ON_CAPTURE is True.
+    """
+    if PREPROCESS_ON_CAPTURE:
+        return (int(np.ceil(predictor.PROCESSING_SIZE * MAX_FRAME_ASPECT_RATIO)), predictor.PROCESSING_SIZE, 3)
+    return MAX_CAMERA_FRAME_SHAPE
+
+
+def processing_scale(frame):
+    """
+    Scale factors (width, height) from a frame resized to predictor.PROCESSING_SIZE
+    back to the given camera frame.
+    """
+    height, width = frame.shape[:2]
+    processed_height = int(height * predictor.PROCESSING_SIZE / float(width))
+    return float(width) / predictor.PROCESSING_SIZE, float(height) / processed_height
+
+
+def preprocess_frame(frame, grayscale=False):
+    """
+    Prepares a camera frame for the prediction process: resizes it to predictor.PROCESSING_SIZE
+    and, if requested, converts it to grayscale.
+
+    Args:
+        frame (np.array): cv2 frame (BGR).
+        grayscale (bool): convert the resized frame to grayscale.
+
+    Returns:
+        processed_frame (np.array): the resized frame.
+        scale (tuple): scale factors (width, height) to map coordinates in processed_frame
+            back to camera pixels.
+    """
+    processed_frame = imutils.resize(frame, width=predictor.PROCESSING_SIZE)
+    if grayscale:
+        processed_frame = cv2.cvtColor(processed_frame, cv2.COLOR_BGR2GRAY)
+
+    height, width = frame.shape[:2]
+    processed_height, processed_width = processed_frame.shape[:2]
+    return processed_frame, (float(width) / processed_width, float(height) / processed_height)
@@ -19,12 +19,15 @@ REACTOR_UPDATE_INTERVAL = 0.1 #Min seconds between reactor updates
 
 class SensorModule(object):
 
-    def __init__(self, emotion_module):
+    def __init__(self, emotion_module, display=True, personSensor=None):
         self.emotion_module = emotion_module
         self.reactors = []
         self.getPersonBodies = False
         self.last_updated_reactors = 0
-        self.personSensor = PersonSensor()
+        # the person sensor can be created beforehand so that its models load while the other modules load
+        if personSensor is None:
+            personSensor = PersonSensor(display)
+        self.personSensor = personSensor
         self.audience = Audience(self.personSensor)
 
 
@@ -0,0 +1,51 @@
+"""
+Micro-benchmark of the Marionette construction cost on the motor command path:
+building a Marionette for each command (as Action used to) vs the shared MarionetteModel.
+
+Usage: python benchmark_marionette.py [number of iterations]
+"""
+
+import sys
+import timeit
+
+from Action import Action
+from Marionette import *
+
+# a position moving all the motors
+TARGET = [21, -980, 0, -2298, 0, 73, 355, 0, -1573, 0, -1919, 821, 90, 90]
+SPEEDS = [5, 15, 0, 5, 5, 10, 5, 5, 5, 5, 5, 5, 32, 32]
+ORIGIN = [0] * len(TARGET)
+
+
+def cmdsWithNewMarionette():
+    # what every motor command used to do
+    marionette = Marionette()
+    output = []
+    for originAngle, targetAngle, speed, motor in zip(ORIGIN, TARGET, SPEEDS, marionette.motorList):
+        if not (targetAngle is None or targetAngle == originAngle or speed == 0):
+            output.append([motor.name, targetAngle, speed])
+    return output
+
+
+def cmdsWithSharedModel():
+    return Action(TARGET, 0.25).getCmdsToTarget(ORIGIN, SPEEDS)
+
+
+def report(name, seconds, iterations):
+    print "%-28s %10.2f us/call" % (name, seconds / iterations * 1e6)
+
+
+if __name__ == "__main__":
+    iterations = 2000
+    if len(sys.argv) > 1:
+        iterations = int(sys.argv[1])
+
+    # build the shared model before timing
+    getMarionetteModel()
+    assert cmdsWithNewMarionette() == cmdsWithSharedModel()
+
+    print "Iterations:", iterations
+    report("Marionette()", timeit.timeit(Marionette, number=iterations), iterations)
+    report("getMarionetteModel()", timeit.timeit(getMarionetteModel, number=iterations), iterations)
+    report("commands, new Marionette", timeit.timeit(cmdsWithNewMarionette, number=iterations), iterations)
+    report("commands, shared model", timeit.timeit(cmdsWithSharedModel, number=iterations), iterations)
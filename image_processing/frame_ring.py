@@ -0,0 +1,118 @@
+import ctypes
+import logging
+import time
+
+from multiprocessing import RawArray
+
+import numpy as np
+
+# the largest frame a slot can hold by default (height, width, channels); the writer should
+# size the slots for the frames it actually sends
+MAX_FRAME_SHAPE = (1080, 1920, 3)
+
+
+class FrameRing(object):
+    """
+    A fixed ring of shared-memory frame slots used to hand camera frames over to the
+    prediction process without pickling them.
+
+    The writer copies a frame into the next slot and only sends a small descriptor
+    (slot index, sequence number, timestamp and shape) through a multiprocessing.Queue.
+    The reader gets a numpy view on the slot from the descriptor. Each slot keeps the
+    sequence number of the frame it holds, so the reader can tell if the slot was
+    overwritten while it was using it.
+
+    The ring must be created before the reader process is started so that the shared
+    memory is inherited by the child process.
+    """
+
+    def __init__(self, n_slots, max_frame_shape=MAX_FRAME_SHAPE):
+        self.n_slots = n_slots
+        self.max_frame_shape = tuple(max_frame_shape)
+        self.slot_size = int(np.prod(self.max_frame_shape))
+
+        # shared memory: frame data, sequence number and timestamp of each slot
+        self._data = RawArray(ctypes.c_uint8, self.n_slots * self.slot_size)
+        self._seqs = RawArray(ctypes.c_long, self.n_slots)
+        self._times = RawArray(ctypes.c_double, self.n_slots)
+        for i in range(self.n_slots):
+            self._seqs[i] = -1
+
+        # the numpy view is created lazily so it is built in the process using it
+        self._buffer = None
+
+        # bookkeeping of the writer
+        self._next_seq = 0
+        # frames that could not be written (larger than a slot or not uint8)
+        self.frames_rejected = 0
+
+
+    def _slot_buffer(self, slot):
+        if self._buffer is None:
+            self._buffer = np.frombuffer(self._data, dtype=np.uint8)
+        return self._buffer[slot * self.slot_size:(slot + 1) * self.slot_size]
+
+
+    def write(self, frame, message_time):
+        """
+        Copy a frame into the next slot of the ring (writer side).
+
+        Args:
+            frame (np.array): cv2 frame (uint8).
+            message_time (datetime): the time the frame was captured.
+
+        Returns:
+            a descriptor (dict) to send to the reader, or None if the frame does not fit in a slot.
+        """
+
+        if frame is None:
+            return None
+        if frame.dtype != np.uint8 or frame.size > self.slot_size:
+            # warn on the first rejected frame, and then from time to time
+            if self.frames_rejected % 1000 == 0:
+                message = 'frame ' + str(frame.shape) + ' ' + str(frame.dtype) + ' does not fit in a ' + \
+                          str(self.max_frame_shape) + ' uint8 slot (' + str(self.frames_rejected + 1) + ' rejected)'
+                print "WARNING ----- FrameRing:", message
+                logging.warning(str(time.time()) + ' FRAME_RING:' + message)
+            self.frames_rejected = self.frames_rejected + 1
+            return None
+
+        seq = self._next_seq
+        self._next_seq = self._next_seq + 1
+        slot = seq % self.n_slots
+
+        # invalidate the slot while it is being written
+        self._seqs[slot] = -1
+        self._slot_buffer(slot)[:frame.size] = frame.reshape(-1)
+        self._times[slot] = time.time()
+        self._seqs[slot] = seq
+
+        return {'slot': slot, 'seq': seq, 'time': message_time, 'shape': frame.shape}
+
+
+    def read(self, descriptor):
+        """
+        Get a view on the frame of a descriptor (reader side). The view is only valid as
+        long as is_valid(descriptor) is True, so the caller should copy or resize it and
+        check is_valid afterwards.
+
+        Returns:
+            np.array view on the frame, or None if the slot was already overwritten.
+        """
+
+        if not self.is_valid(descriptor):
+            return None
+
+        shape = descriptor['shape']
+        size = int(np.prod(shape))
+        return self._slot_buffer(descriptor['slot'])[:size].reshape(shape)
+
+
+    def is_valid(self, descriptor):
+        """Returns True if the slot of the descriptor still holds the frame of the descriptor."""
+        return self._seqs[descriptor['slot']] == descriptor['seq']
+
+
+    def timestamp(self, descriptor):
+        """Returns the time (time.time()) at which the slot of the descriptor was written."""
+        return self._times[descriptor['slot']]
@@ -1,7 +1,9 @@
 import os, sys
-import copy
+import threading
+import time
 
 from datetime import datetime, timedelta
+from Queue import Empty
 
 import numpy as np
 import tensorflow as tf
@@ -23,34 +25,98 @@ AGE_GENDER_MODEL_PATH = MODULE_PATH + '/models/model_age_gender'
 PROCESSING_SIZE = 1200
 UPSAMPLE_COUNT = 2
 BATCH_SIZE = 1
+MAX_BATCH_SIZE = 4
 
 # CPU PARAMS
 #PROCESSING_SIZE = 800
 #UPSAMPLE_COUNT = 0
 #BATCH_SIZE = 1
+#MAX_BATCH_SIZE = 1
+
+# grow the batch size (up to MAX_BATCH_SIZE) when frames are waiting in the queue and
+# shrink it when the queue is empty or when a batch takes longer than MAX_BATCH_LATENCY_MS
+ENABLE_ADAPTIVE_BATCH_SIZE = True
+MAX_BATCH_LATENCY_MS = timedelta(milliseconds=250)
 
 ENABLE_AGEGENDER_DETECTION = True
 
+# align and crop the detected faces (only needed by consumers of face images)
+ENABLE_FACE_CROPS = False
+
+# search for faces only in crops around the last known faces, with a periodic full-frame
+# sweep (with FULL_SWEEP_UPSAMPLE_COUNT) to find the persons that just arrived
+ENABLE_ROI_DETECTION = True
+ROI_FULL_SWEEP_INTERVAL = 10 # one frame out of ROI_FULL_SWEEP_INTERVAL is searched entirely
+FULL_SWEEP_UPSAMPLE_COUNT = 1
+ROI_MARGIN = 0.5 # margin added around a known face, as a fraction of the face size
+ROI_OVERLAP_THRESHOLD = 0.5 # faces found in overlapping crops are the same if they overlap more than this
+
+# reuse the face descriptor of a known face whose box barely moved instead of computing it again
+ENABLE_DESCRIPTOR_REUSE = True
+DESCRIPTOR_REUSE_OVERLAP = 0.85
+# do not predict age/gender for the known faces whose estimate is already final (see Person.MAX_NUM_SAMPLES)
+ENABLE_AGEGENDER_SKIP = True
+AGEGENDER_SKIP_OVERLAP = 0.5 # a detected face is a saturated known face if it overlaps it more than this
+
 MESSAGE_EXPIRE_MS = timedelta(milliseconds=100)
 
 GENDER_MAP = {0: 'M', 1: 'F'}
 AGE_MAP = {0: 'child', 1: 'adult', 2: 'senior'}
 
 
-def load_dlib_module():
+def start_loading(name, load_function, timings):
+    """
+    Starts loading a model in a thread.
+
+    Args:
+        name (str): name of the model, used as key in timings.
+        load_function (function): function returning the model.
+        timings (dict): the seconds taken to load the model are added to this dict once loaded.
+
+    Returns:
+        thread (threading.Thread): the loading thread.
+        result (dict): {'model': the model} once the thread is done.
     """
-    Loads the dlib models for face detection and recognition. This function assumes that
-    the model is in './models' directory.
+
+    result = {}
+
+    def load():
+        start_time = time.time()
+        result['model'] = load_function()
+        timings[name] = time.time() - start_time
+
+    thread = threading.Thread(name='load ' + name, target=load)
+    thread.setDaemon(True)
+    thread.start()
+    return thread, result
+
+
+def load_dlib_module(timings=None):
+    """
+    Loads the dlib models for face detection and recognition (at the same time). This function
+    assumes that the model is in './models' directory.
+
+    Args:
+        timings (dict): the seconds taken to load each model are added to this dict.
 
     Returns:
         a dictionary containing cnn, shape_predictor, and recognition model.
     """
 
-    cnn = dlib.cnn_face_detection_model_v1(FACE_DETECTION_MODEL_PATH)
-    shape_predictor = dlib.shape_predictor(SHAPE_PREDICTION_MODEL_PATH)
-    recognition_model = dlib.face_recognition_model_v1(FACE_RECOGNITION_MODEL_PATH)
+    if timings is None:
+        timings = {}
+    loading = {'cnn': start_loading('cnn', lambda: dlib.cnn_face_detection_model_v1(FACE_DETECTION_MODEL_PATH), timings),
+               'shape_predictor': start_loading('shape_predictor', lambda: dlib.shape_predictor(SHAPE_PREDICTION_MODEL_PATH), timings),
+               'recognition_model': start_loading('recognition_model', lambda: dlib.face_recognition_model_v1(FACE_RECOGNITION_MODEL_PATH), timings)}
 
-    return {'cnn': cnn, 'shape_predictor': shape_predictor, 'recognition_model': recognition_model}
+    dlib_models = {}
+    for name, (thread, result) in loading.items():
+        thread.join()
+        if not 'model' in result:
+            raise IOError("could not load the dlib model " + name)
+        dlib_models[name] = result['model']
+
+    return dlib_models
 
 
 def load_age_and_gender_model():
@@ -68,7 +134,137 @@ def load_age_and_gender_model():
     return predictor_age_gender
 
 
-def detect_faces(color_image_list, gray_image_list, dlib_models):
+def expand_roi(roi, image_shape):
+    """
+    Adds a margin of ROI_MARGIN around a known face rect and clips it to the image.
+
+    Args:
+        roi (tuple): (left, top, right, bottom) of a known face.
+        image_shape (tuple): shape of the image.
+
+    Returns:
+        (left, top, right, bottom) of the crop to search.
+    """
+
+    left, top, right, bottom = roi
+    margin_x = int((right - left) * ROI_MARGIN)
+    margin_y = int((bottom - top) * ROI_MARGIN)
+    height, width = image_shape[:2]
+    return (max(0, int(left) - margin_x), max(0, int(top) - margin_y),
+            min(width, int(right) + margin_x), min(height, int(bottom) + margin_y))
+
+
+def rects_overlap(rect1, rect2):
+    """Returns the intersection over union of two dlib.rectangle."""
+    intersection = rect1.intersect(rect2)
+    if intersection.is_empty():
+        return 0.0
+    union = rect1.area() + rect2.area() - intersection.area()
+    return float(intersection.area()) / union
+
+
+def match_known_face(face_rect, known_faces):
+    """
+    Finds the known face overlapping the most with a detected face.
+
+    Args:
+        face_rect (dlib.rectangle): a detected face.
+        known_faces (list): list of dicts {'rect': (left, top, right, bottom), 'descriptor': face descriptor
+            or None, 'saturated': True if the age/gender of the face does not need more samples}.
+
+    Returns:
+        known_face, overlap or None, 0.0 if no known face overlaps.
+    """
+
+    best_face = None
+    best_overlap = 0.0
+    for known_face in known_faces or []:
+        left, top, right, bottom = known_face['rect']
+        overlap = rects_overlap(face_rect, dlib.rectangle(int(left), int(top), int(right), int(bottom)))
+        if overlap > best_overlap:
+            best_face = known_face
+            best_overlap = overlap
+    return best_face, best_overlap
+
+
+def new_stats():
+    """Returns the counters of the work done and saved by a prediction process."""
+    return {'frames': 0, 'faces': 0,
+            'descriptors_computed': 0, 'descriptors_reused': 0,
+            'age_gender_predicted': 0, 'age_gender_skipped': 0}
+
+
+def detect_face_rects_in_rois(gray_image, rois, dlib_models):
+    """
+    Detects faces using Dlib's CNN model in crops of an image around known faces.
+
+    Args:
+        gray_image (np.array): image in grayscale.
+        rois (list): list of (left, top, right, bottom) of the known faces.
+        dlib_models (dict): a dictionary containing dlib cnn, shape_predictor, and recognition models.
+
+    Returns:
+        a list of dlib.rectangle in the coordinates of the image.
+    """
+
+    rects = []
+    for roi in rois:
+        left, top, right, bottom = expand_roi(roi, gray_image.shape)
+        if right <= left or bottom <= top:
+            continue
+        crop = np.ascontiguousarray(gray_image[top:bottom, left:right])
+        for detection in dlib_models['cnn'](crop, upsample_num_times=UPSAMPLE_COUNT):
+            rect = dlib.rectangle(detection.rect.left() + left, detection.rect.top() + top,
+                                  detection.rect.right() + left, detection.rect.bottom() + top)
+            # the same face can be found in the crops of two close faces
+            if all(rects_overlap(rect, other) < ROI_OVERLAP_THRESHOLD for other in rects):
+                rects.append(rect)
+    return rects
+
+
+def detect_face_rects(gray_image_list, dlib_models, rois_list=None, upsample_list=None):
+    """
+    Detects faces using Dlib's CNN model.
+
+    Args:
+        gray_image_list (list): list of images in grayscale.
+        dlib_models (dict): a dictionary containing dlib cnn, shape_predictor, and recognition models.
+        rois_list (list): for each image, a list of (left, top, right, bottom) of known faces to search
+            around, or None to search the whole image.
+        upsample_list (list): for each image searched entirely, the number of times to upsample it.
+
+    Returns:
+        a list with one item per image. Each item is a list of dlib.rectangle.
+    """
+
+    if rois_list is None:
+        rois_list = [None] * len(gray_image_list)
+    if upsample_list is None:
+        upsample_list = [UPSAMPLE_COUNT] * len(gray_image_list)
+
+    rects_list = [None] * len(gray_image_list)
+
+    # images searched entirely are processed in one batch per upsample count
+    for upsample_count in set(upsample_list):
+        indices = [i for i in range(len(gray_image_list))
+                   if rois_list[i] is None and upsample_list[i] == upsample_count]
+        if len(indices) == 0:
+            continue
+        mmod_rects = dlib_models['cnn']([gray_image_list[i] for i in indices], upsample_num_times=upsample_count)
+        # mmod_rects is a list of list of rectangles
+        for i, image_detection_rects in zip(indices, mmod_rects):
+            rects_list[i] = [d.rect for d in image_detection_rects]
+
+    # the other images are only searched around their known faces
+    for i, rois in enumerate(rois_list):
+        if not rois is None:
+            rects_list[i] = detect_face_rects_in_rois(gray_image_list[i], rois, dlib_models)
+
+    return rects_list
+
+
+def detect_faces(color_image_list, gray_image_list, dlib_models, crop_faces=False, rois_list=None, upsample_list=None,
+                 known_faces_list=None, stats=None):
     """
     Detects faces using Dlib's CNN model.
 
@@ -77,9 +273,16 @@ def detect_faces(color_image_list, gray_image_list, dlib_models):
         gray_image_list (list): list of images in grayscale. This list should contain the same images
             as the color_image_list, but in grayscale. This list is used by the CNN model.
         dlib_models (dict): a dictionary containing dlib cnn, shape_predictor, and recognition models.
+        crop_faces (bool): align and crop the detected faces. This is costly and the faces images
+            are not needed for recognition or age/gender detection.
+        rois_list (list): see detect_face_rects.
+        upsample_list (list): see detect_face_rects.
+        known_faces_list (list): for each image, a list of known faces (see match_known_face). The descriptor
+            of a known face is reused for a detected face overlapping it more than DESCRIPTOR_REUSE_OVERLAP.
+        stats (dict): counters to update (see new_stats).
 
     Returns:
-        face_images (np.array): an array of images of detected faces.
+        face_images (np.array): an array of images of detected faces (empty if crop_faces is False).
         n_faces_list (list): a list of ints showing the number of detected faces in each frame.
         flat_face_rects (list): a list of dlib.rectangle objects containing rectangle info of each detected face.
         face_descriptors (list): list of face_descriptor. A face_descriptor is a lists of 128 dim vector that describes the face.
@@ -97,28 +300,40 @@ def detect_faces(color_image_list, gray_image_list, dlib_models):
         different size but again smaller than Img1.
     """
 
-    mmod_rects = dlib_models['cnn'](gray_image_list, upsample_num_times=UPSAMPLE_COUNT)
+    rects_list = detect_face_rects(gray_image_list, dlib_models, rois_list, upsample_list)
+    if known_faces_list is None or not ENABLE_DESCRIPTOR_REUSE:
+        known_faces_list = [None] * len(rects_list)
 
     flat_face_rects = []
     flat_image_list_indices = []
     n_faces_list = []
     all_shapes_list = []
-    # mmod_rects is a list of list of rectangles
-    for i, image_detection_rects in enumerate(mmod_rects):
+    # the descriptors reused from the known faces, per image (None where it must be computed)
+    reused_descriptors_list = []
+    # rects_list is a list of list of rectangles
+    for i, image_detection_rects in enumerate(rects_list):
         rects = dlib.rectangles()
 
         # save rects into an array to use later
-        rects.extend([d.rect for d in image_detection_rects])
+        rects.extend(image_detection_rects)
         flat_face_rects.extend(rects)
         flat_image_list_indices.extend([i]*len(image_detection_rects))
         n_faces_list.append(len(image_detection_rects))
 
         # find shapes in the image -- this is used for face recognition
         faces = dlib.full_object_detections()
+        reused_descriptors = []
         for r in rects:
+            known_face, overlap = match_known_face(r, known_faces_list[i])
+            if overlap >= DESCRIPTOR_REUSE_OVERLAP and not known_face['descriptor'] is None:
+                # the face barely moved -- keep its descriptor
+                reused_descriptors.append(known_face['descriptor'])
+                continue
+            reused_descriptors.append(None)
             shape = dlib_models['shape_predictor'](color_image_list[i], r)
             faces.append(shape)
         all_shapes_list.append(faces)
+        reused_descriptors_list.append(reused_descriptors)
 
     # in the above example
     # flat_face_rects = [r1, r2, r3, r4, r5]
@@ -126,20 +341,32 @@ def detect_faces(color_image_list, gray_image_list, dlib_models):
     # n_faces_list = [3, 2]
     # all_shapes_list = [dlib.full_object_detections, dlib.full_object_detections]
 
-    # align detected rectangles to get faces for the next step
-    fa = FaceAligner(dlib_models['shape_predictor'])
+    # align detected rectangles to get faces for the next step (only if requested)
     face_images = []
-    for i, rect in enumerate(flat_face_rects):
-        image_index = flat_image_list_indices[i]
-        aligned_image = fa.align(color_image_list[image_index], gray_image_list[image_index], rect)
-        aligned_image = imutils.resize(aligned_image, width=160, height=160)
-        face_images.append(aligned_image)
+    if crop_faces:
+        if not 'face_aligner' in dlib_models:
+            dlib_models['face_aligner'] = FaceAligner(dlib_models['shape_predictor'])
+        fa = dlib_models['face_aligner']
+        for i, rect in enumerate(flat_face_rects):
+            image_index = flat_image_list_indices[i]
+            aligned_image = fa.align(color_image_list[image_index], gray_image_list[image_index], rect)
+            aligned_image = imutils.resize(aligned_image, width=160, height=160)
+            face_images.append(aligned_image)
 
     # in the above example
     # face_images = [img1, img2, img3, img4, img5]
 
-    # face encodings
-    face_descriptors = dlib_models['recognition_model'].compute_face_descriptor(color_image_list, all_shapes_list)
+    # face encodings (only for the faces without a reused descriptor)
+    computed_descriptors = dlib_models['recognition_model'].compute_face_descriptor(color_image_list, all_shapes_list)
+    face_descriptors = []
+    for reused_descriptors, image_computed_descriptors in zip(reused_descriptors_list, computed_descriptors):
+        image_computed_descriptors = iter(image_computed_descriptors)
+        face_descriptors.append([next(image_computed_descriptors) if descriptor is None else descriptor
+                                 for descriptor in reused_descriptors])
+        if not stats is None:
+            n_reused = len([descriptor for descriptor in reused_descriptors if not descriptor is None])
+            stats['descriptors_reused'] += n_reused
+            stats['descriptors_computed'] += len(reused_descriptors) - n_reused
     # face_descriptor is a lists of 128 dim vector that describes the face.
     # if two face descriptor vectors have a Euclidean distance between them less than 0.6
     # then they are from the same person
@@ -149,7 +376,8 @@ def detect_faces(color_image_list, gray_image_list, dlib_models):
     return np.array(face_images), n_faces_list, flat_face_rects, face_descriptors
 
 
-def process_batch_frames(color_image_list, gray_image_list, predictor_age_gender, dlib_models):
+def process_batch_frames(color_image_list, gray_image_list, predictor_age_gender, dlib_models, rois_list=None, upsample_list=None,
+                         known_faces_list=None, stats=None):
     """
     Processes a batch of images to detect faces and if ENABLE_AGEGENDER_DETECTION is True it also
     predicts ages and genders of each detected faces.
@@ -158,114 +386,297 @@ def process_batch_frames(color_image_list, gray_image_list, predictor_age_gender
         color_image_list (list): list of images. Each item is a frame read by the cv2 package.
         gray_image_list (list): list of images in grayscale. This list should contain the same images
             as the color_image_list, but in grayscale. This list is used by the CNN model.
-        predictor_age_gender (sklearn.??): the model for predicting age and gender.
+        predictor_age_gender (sklearn.??): the model for predicting age and gender (None if not loaded yet).
         dlib_models (dict): a dictionary containing dlib cnn, shape_predictor, and recognition models.
+        rois_list (list): see detect_face_rects.
+        upsample_list (list): see detect_face_rects.
+        known_faces_list (list): see detect_faces. Age/gender is not predicted for a detected face overlapping a
+            saturated known face more than AGEGENDER_SKIP_OVERLAP.
+        stats (dict): counters to update (see new_stats).
 
     Returns:
         n_faces_list (list): list of ints containing the number of detected faces for each frame. So, the
             length of this list is equal to the length if color_image_list and gray_image_list.
         face_rects (list): lists of rectangle of faces. Each rectangle is a dlib.rectangle object.
         face_descriptors (list): list of face_descriptor. A face_descriptor is a lists of 128 dim vector that describes the face.
-        age_genders_proba (list): list of probas of age/gender. First item is proba of child, second is proba of adult male, third is for adult female and last is senior.
+        age_genders_proba (list): list of probas of age/gender of each face in face_rects. First item is proba of child,
+            second is proba of adult male, third is for adult female and last is senior. The probas of a
+            face are None if they were not predicted (saturated known face).
     """
 
-    # detect faces
-    face_images_array, n_faces_list, face_rects, face_descriptors = detect_faces(color_image_list, gray_image_list, dlib_models)
+    if known_faces_list is None:
+        known_faces_list = [None] * len(color_image_list)
 
-    # detect age and gender for all frames
+    # detect faces
+    face_images_array, n_faces_list, face_rects, face_descriptors = detect_faces(color_image_list, gray_image_list, dlib_models,
+                                                                                 crop_faces=ENABLE_FACE_CROPS,
+                                                                                 rois_list=rois_list,
+                                                                                 upsample_list=upsample_list,
+                                                                                 known_faces_list=known_faces_list,
+                                                                                 stats=stats)
+
+    if not stats is None:
+        stats['frames'] += len(color_image_list)
+        stats['faces'] += len(face_rects)
+
+    # detect age and gender for all the faces of all the frames at once
     age_genders_probas = []
-    if ENABLE_AGEGENDER_DETECTION:
-        # no support for batch yet
-        encodings = np.array(face_descriptors)[0]
-        if len(encodings) > 0:
-            age_genders_probas = predictor_age_gender.predict_proba(encodings)
-
-            ## debug: write images to disk for inspection
-#            for img in face_images_array:
-#                fname = "img" + str(frame_number) + ".png"
-#                print("writing to file: " + fname)
-#                cv2.imwrite(fname, img)
+    if ENABLE_AGEGENDER_DETECTION and not predictor_age_gender is None:
+        age_genders_probas = [None] * len(face_rects)
+        # indices of the faces that still need an age/gender prediction
+        indices = []
+        face_index = 0
+        for frame_index, frame_descriptors in enumerate(face_descriptors):
+            for descriptor in frame_descriptors:
+                known_face, overlap = match_known_face(face_rects[face_index], known_faces_list[frame_index])
+                if not (ENABLE_AGEGENDER_SKIP and overlap >= AGEGENDER_SKIP_OVERLAP and known_face['saturated']):
+                    indices.append(face_index)
+                face_index = face_index + 1
+        if len(indices) > 0:
+            encodings = [np.array(descriptor) for frame_descriptors in face_descriptors for descriptor in frame_descriptors]
+            probas = predictor_age_gender.predict_proba(np.array([encodings[i] for i in indices]))
+            for i, face_probas in zip(indices, probas):
+                age_genders_probas[i] = face_probas
+        if not stats is None:
+            stats['age_gender_predicted'] += len(indices)
+            stats['age_gender_skipped'] += len(face_rects) - len(indices)
 
     return n_faces_list, face_rects, face_descriptors, age_genders_probas
 
 
-def process_image(frame_queue, prediction_queue):
+def split_frame_predictions(n_faces_list, face_rects, face_descriptors, age_genders_probas):
     """
-    The main function for the prediction process. This will process frames to
-    detect faces, ages and genders.
+    Splits the flat results of process_batch_frames into the predictions of each frame.
+
+    Returns:
+        a list with one item per frame. Each item is a list of tuples (face_rect, face_descriptor, age_gender_probas),
+        one tuple per face detected in the frame. age_gender_probas is None if ENABLE_AGEGENDER_DETECTION is False
+        or if it was skipped for the face.
     """
 
-    dlib_models = load_dlib_module()
-    predictor_age_gender = load_age_and_gender_model()
+    frame_predictions = []
+    first_face_index = 0
+    for frame_index, n_faces in enumerate(n_faces_list):
+        last_face_index = first_face_index + n_faces
+        if len(age_genders_probas) > 0:
+            probas = list(age_genders_probas[first_face_index:last_face_index])
+        else:
+            probas = [None] * n_faces
+        frame_predictions.append(list(zip(face_rects[first_face_index:last_face_index],
+                                          face_descriptors[frame_index],
+                                          probas)))
+        first_face_index = last_face_index
 
-    print("model initialized.")
+    return frame_predictions
 
-    batch_counter = 0
-    batch_color_image_list = []
-    batch_gray_image_list = []
 
-    # this includes the last predicted faces rects plus ages and genders to display on frames
-    last_frame_predictions = []
+def next_batch_size(batch_size, backlog, batch_latency):
+    """
+    Adapts the batch size to the load of the prediction process.
 
-    print("starting predictions...")
+    Args:
+        batch_size (int): the current batch size.
+        backlog (int): the number of frames still waiting in the queue.
+        batch_latency (timedelta): the age of the oldest frame of the last batch once it was processed.
 
-    # this thread waits in this infinite loop until the main thread exits
-    while True:
+    Returns:
+        the batch size to use for the next batch.
+    """
 
-        # get one frame to process; wait if necessary for a new frame to process
-        message = frame_queue.get(True)
-        # check if the frame is expired
-        if datetime.now() - message['time'] > MESSAGE_EXPIRE_MS:
-            # continue to get another message
-            continue
+    if not ENABLE_ADAPTIVE_BATCH_SIZE:
+        return BATCH_SIZE
+    if batch_latency > MAX_BATCH_LATENCY_MS or backlog == 0:
+        # latency matters more than throughput
+        return max(1, batch_size - 1)
+    if backlog >= batch_size:
+        # frames are piling up
+        return min(MAX_BATCH_SIZE, batch_size + 1)
+    return batch_size
 
-        # process the message
-        frame = copy.deepcopy(message['frame'])
 
-        # resize the frame
-        resized_frame = imutils.resize(frame, width=PROCESSING_SIZE)
+def queue_backlog(queue):
+    """Returns the approximate number of messages in a queue (0 where qsize is not implemented)."""
+    try:
+        return queue.qsize()
+    except NotImplementedError:
+        return 0
+
+
+def read_frame(message, frame_ring):
+    """
+    Reads the frame of a message from the shared memory and prepares it for the models.
+
+    Returns:
+        color_frame, gray_frame or None, None if the message expired or the frame was overwritten.
+    """
 
+    # check if the frame is expired
+    if datetime.now() - message['time'] > MESSAGE_EXPIRE_MS:
+        return None, None
+
+    # get a view on the frame in shared memory
+    frame = frame_ring.read(message)
+    if frame is None:
+        # the slot was already overwritten by a newer frame
+        return None, None
+
+    # resize the frame (this copies it out of the shared memory)
+    if frame.shape[1] == PROCESSING_SIZE:
+        # already resized on the capture side
+        resized_frame = frame.copy()
+    else:
+        resized_frame = imutils.resize(frame, width=PROCESSING_SIZE)
+    if not frame_ring.is_valid(message):
+        # the slot was overwritten while resizing
+        return None, None
+
+    if resized_frame.ndim == 2:
+        # already converted to grayscale on the capture side; the shape predictor and
+        # the recognition model still need a 3 channels image
+        gray_frame = resized_frame
+        resized_frame = cv2.cvtColor(gray_frame, cv2.COLOR_GRAY2BGR)
+    else:
         # convert the color to grayscale
         gray_frame = cv2.cvtColor(resized_frame, cv2.COLOR_BGR2GRAY)
 
-        # append to the batch image list
-        batch_color_image_list.append(resized_frame)
-        batch_gray_image_list.append(gray_frame)
+    return resized_frame, gray_frame
+
+
+def send_results(prediction_queue, message, predictions, worker_id, stats):
+    """
+    Sends the results of a frame back to the main process.
+
+    Args:
+        prediction_queue (multiprocessing.Queue): queue to send back the prediction results.
+        message (dict): the descriptor of the frame.
+        predictions (list): list of (face_rect, face_descriptor, age_gender_probas), or None if the
+            frame was skipped.
+        worker_id (int): the id of this prediction process.
+        stats (dict): the counters of this prediction process since it started (see new_stats).
+    """
+
+    try:
+        prediction_queue.put({'seq': message['seq'], 'dispatch': message.get('dispatch', message['seq']),
+                              'time': message['time'], 'worker': worker_id, 'predictions': predictions,
+                              'stats': dict(stats)}, False)
+    except:
+        # if the queue is full drop the results
+        pass
 
-        # check the batch counter
-        batch_counter = batch_counter + 1
-        if batch_counter < BATCH_SIZE:
+
+def send_status(prediction_queue, worker_id, status, timings):
+    """
+    Lets the main process know that models are loaded.
+
+    Args:
+        prediction_queue (multiprocessing.Queue): queue to send back the prediction results.
+        worker_id (int): the id of this prediction process.
+        status (str): 'detection_ready' once frames can be processed, 'age_gender_ready' once age/gender
+            is predicted too.
+        timings (dict): the seconds taken to load each model.
+    """
+
+    try:
+        prediction_queue.put({'worker': worker_id, 'status': status, 'timings': dict(timings)}, False)
+    except:
+        pass
+
+
+def process_image(frame_queue, prediction_queue, frame_ring, worker_id=0):
+    """
+    The main function for the prediction process. This will process frames to
+    detect faces, ages and genders.
+
+    Args:
+        frame_queue (multiprocessing.Queue): queue of frame descriptors written by FrameRing.write. A descriptor
+            can also have 'rois' (see detect_face_rects), 'upsample' (upsample count for a full-frame search) and
+            'known_faces' (see match_known_face).
+        prediction_queue (multiprocessing.Queue): queue to send back the prediction results. One message
+            is sent per frame taken from frame_queue: {'seq': frame sequence number, 'dispatch': dispatch number
+            given by PredictorPool, 'time': frame time, 'worker': worker_id,
+            'predictions': list of (face_rect, face_descriptor, age_gender_probas) or None if the frame was skipped,
+            'stats': counters of this process since it started (see new_stats)}.
+        frame_ring (FrameRing): the shared memory holding the frames of the descriptors.
+        worker_id (int): the id of this prediction process in a PredictorPool.
+
+    Status messages are also sent once the models are loaded (see send_status). The frames are processed
+    as soon as the dlib models are loaded, without age/gender until its model is loaded too.
+    """
+
+    # load all the models at the same time
+    timings = {}
+    age_gender_loading = None
+    if ENABLE_AGEGENDER_DETECTION:
+        age_gender_loading = start_loading('age_gender', load_age_and_gender_model, timings)
+    dlib_models = load_dlib_module(timings)
+    predictor_age_gender = None
+
+    print("model initialized: " + str(timings))
+    send_status(prediction_queue, worker_id, 'detection_ready', timings)
+
+    batch_size = BATCH_SIZE
+    stats = new_stats()
+
+    print("starting predictions...")
+
+    # this thread waits in this infinite loop until the main thread exits
+    while True:
+
+        # start predicting age/gender once its model is loaded
+        if predictor_age_gender is None and not age_gender_loading is None and not age_gender_loading[0].is_alive():
+            predictor_age_gender = age_gender_loading[1].get('model')
+            age_gender_loading = None
+            if not predictor_age_gender is None:
+                print("age and gender model initialized: " + str(timings))
+                send_status(prediction_queue, worker_id, 'age_gender_ready', timings)
+
+        # get one frame to process; wait if necessary for a new frame to process
+        messages = [frame_queue.get(True)]
+        # complete the batch with the frames already waiting (do not wait for more)
+        while len(messages) < batch_size:
+            try:
+                messages.append(frame_queue.get(False))
+            except Empty:
+                break
+
+        batch_messages = []
+        batch_color_image_list = []
+        batch_gray_image_list = []
+        for message in messages:
+            color_frame, gray_frame = read_frame(message, frame_ring)
+            if color_frame is None:
+                # let the main process know the frame was skipped
+                send_results(prediction_queue, message, None, worker_id, stats)
+                continue
+            batch_messages.append(message)
+            batch_color_image_list.append(color_frame)
+            batch_gray_image_list.append(gray_frame)
+
+        if len(batch_messages) == 0:
             continue
 
-        # time to process the frame to detect face/age/gender
+        # time to process the frames to detect face/age/gender
         n_faces_list, face_rects, face_descriptors, age_genders_probas = process_batch_frames(
             batch_color_image_list,
             batch_gray_image_list,
             predictor_age_gender,
-            dlib_models
+            dlib_models,
+            [message.get('rois') for message in batch_messages],
+            [message.get('upsample', UPSAMPLE_COUNT) for message in batch_messages],
+            [message.get('known_faces') for message in batch_messages],
+            stats
         )
 
-        # since we processed the batch, we should empty lists for the next batch
-        batch_counter = 0
-        batch_color_image_list = []
-        batch_gray_image_list = []
-
         # display results on the terminal
         # display_results(n_faces_list, age_genders_probas)
 
-        # update the last_faces_rects and update the frame to display
-        last_face_index = sum(n_faces_list) - n_faces_list[-1]
-        if ENABLE_AGEGENDER_DETECTION:
-            last_frame_predictions = list(zip(face_rects[last_face_index:],
-                                              face_descriptors[len(face_descriptors)-1],
-                                              age_genders_probas[last_face_index:]))
-        else:
-            last_frame_predictions = list(zip(face_rects[last_face_index:],
-                                              face_descriptors[len(face_descriptors)-1],
-                                              [None]*len(face_rects[last_face_index:])))
+        # send the results of each frame in order
+        frame_predictions = split_frame_predictions(n_faces_list, face_rects, face_descriptors, age_genders_probas)
+        for message, predictions in zip(batch_messages, frame_predictions):
+            send_results(prediction_queue, message, predictions, worker_id, stats)
 
-        # set the results for display in the main thread
-        prediction_queue.put(last_frame_predictions, False)
+        # adapt the batch size for the next batch
+        batch_size = next_batch_size(batch_size, queue_backlog(frame_queue), datetime.now() - batch_messages[0]['time'])
 
     print("-----------\n")
     print("done.")
@@ -0,0 +1,165 @@
+import heapq
+import time
+
+from multiprocessing import Process, Queue
+
+from image_processing import predictor
+
+# seconds to wait for a missing result before releasing the newer ones
+REORDER_TIMEOUT = 1.0
+
+
+class PredictorPool(object):
+    """
+    A pool of prediction processes (predictor.process_image). Each process loads the models
+    once and has its own queue of frame descriptors. Frames are sent to the least loaded
+    process and the results of all the processes are merged back in the order the frames
+    were sent, so that older results never replace newer ones.
+    """
+
+    def __init__(self, n_workers, frame_ring, queue_max_messages):
+        """
+        Args:
+            n_workers (int): number of prediction processes.
+            frame_ring (FrameRing): the shared memory the frames are written to. It must be
+                created before the pool so that the processes inherit it.
+            queue_max_messages (int): maximum number of frames waiting for each process.
+        """
+
+        self.n_workers = n_workers
+        self._frame_queues = [Queue(queue_max_messages) for i in range(n_workers)]
+        # the results queue is emptied by get_results every update so it is not bounded:
+        # every frame taken by a process must give a result for the reordering
+        self._results_queue = Queue()
+
+        # number of frames sent to each process and not answered yet
+        self._in_flight = [0] * n_workers
+        # number given to each frame sent, in order
+        self._next_dispatch = 0
+
+        # results received ahead of older ones, as a heap of (dispatch number, results)
+        self._pending_results = []
+        self._next_dispatch_out = 0
+        self._blocked_since = None
+
+        # the latest counters of each process (see predictor.new_stats)
+        self._worker_stats = [predictor.new_stats() for i in range(n_workers)]
+        # the processes that loaded their detection models (frames are only sent to them)
+        self._ready = [False] * n_workers
+        self.age_gender_ready = False
+
+        self._processes = []
+        for worker_id in range(n_workers):
+            process = Process(target=predictor.process_image,
+                              args=(self._frame_queues[worker_id], self._results_queue, frame_ring, worker_id))
+            process.daemon = True
+            process.start()
+            self._processes.append(process)
+
+
+    def release(self):
+        for frame_queue in self._frame_queues:
+            frame_queue.close()
+        self._results_queue.close()
+        for process in self._processes:
+            process.terminate()
+
+
+    def ready(self):
+        """Returns True if at least one process loaded its models."""
+        return any(self._ready)
+
+
+    def full(self):
+        """Returns True if no process can take another frame."""
+        return all(not self._ready[worker_id] or self._frame_queues[worker_id].full()
+                   for worker_id in range(self.n_workers))
+
+
+    def submit(self, descriptor):
+        """
+        Send a frame descriptor to the least loaded process.
+
+        Returns:
+            True if the frame was sent, False if all the queues are full (or no process is ready).
+        """
+
+        workers = sorted([worker_id for worker_id in range(self.n_workers) if self._ready[worker_id]],
+                         key=lambda worker_id: self._in_flight[worker_id])
+        for worker_id in workers:
+            descriptor['dispatch'] = self._next_dispatch
+            try:
+                self._frame_queues[worker_id].put(descriptor, False)
+            except:
+                # this queue is full, try the next one
+                continue
+            self._in_flight[worker_id] = self._in_flight[worker_id] + 1
+            self._next_dispatch = self._next_dispatch + 1
+            return True
+        return False
+
+
+    def stats(self):
+        """Returns the counters of all the processes added together (see predictor.new_stats)."""
+        total = predictor.new_stats()
+        for worker_stats in self._worker_stats:
+            for key, value in worker_stats.items():
+                total[key] = total.get(key, 0) + value
+        return total
+
+
+    def _update_status(self, message):
+        """Handles a status message of a process (see predictor.send_status)."""
+        if message['status'] == 'detection_ready':
+            self._ready[message['worker']] = True
+        elif message['status'] == 'age_gender_ready':
+            self.age_gender_ready = True
+        print("predictor " + str(message['worker']) + " " + message['status'] + " (load times: " +
+              ', '.join(name + ' %.1fs' % seconds for name, seconds in sorted(message['timings'].items())) + ")")
+
+
+    def get_results(self):
+        """
+        Get the new prediction results of all the processes, in the order the frames were sent.
+        A result is held back while the results of older frames are still expected (at most
+        REORDER_TIMEOUT seconds).
+
+        Returns:
+            list of results messages (see predictor.process_image) of the frames that were processed.
+        """
+
+        while True:
+            try:
+                results = self._results_queue.get(False)
+            except:
+                break
+            if 'status' in results:
+                self._update_status(results)
+                continue
+            self._in_flight[results['worker']] = max(0, self._in_flight[results['worker']] - 1)
+            if 'stats' in results:
+                self._worker_stats[results['worker']] = results['stats']
+            heapq.heappush(self._pending_results, (results['dispatch'], results))
+
+        results_list = []
+        while len(self._pending_results) > 0:
+            dispatch, results = self._pending_results[0]
+            if dispatch > self._next_dispatch_out:
+                # an older result is missing -- wait for it for a while
+                if self._blocked_since is None:
+                    self._blocked_since = time.time()
+                if time.time() - self._blocked_since < REORDER_TIMEOUT:
+                    break
+                self._next_dispatch_out = dispatch
+
+            heapq.heappop(self._pending_results)
+            self._blocked_since = None
+            if dispatch < self._next_dispatch_out:
+                # arrived after a newer result was released
+                continue
+            self._next_dispatch_out = dispatch + 1
+            # frames skipped by the process (expired or overwritten) have no predictions
+            if not results['predictions'] is None:
+                results_list.append(results)
+
+        return results_list
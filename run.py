@@ -3,17 +3,14 @@ import time
 import cv2
 
 from SensorModule import SensorModule
+from PersonSensor import PersonSensor
 from EmotionModule import EmotionModule
 from ResponseModule import ResponseModule
 from ActionModule import ActionModule
-
-import ArduinoCommunicator
+from DisplaySink import DISPLAY_MAX_FPS
 
 import sys
-
-from PyQt5.QtWidgets import *
-from PyQt5.QtCore import *
-from PyQt5.QtGui import *
+import signal
 
 import os
 
@@ -28,147 +25,12 @@ BACK_CAMERA = 1
 
 TEST_WIHOUT_RASP = False
 
-class AppRun(QWidget):
-
-    def __init__(self, realRun=None):
-        super(AppRun, self).__init__()
-        self.setWindowTitle('Cat\'s Cradle')
-        self.move(0, 0)
-        self.realRun = realRun
-
-        self.loadingDialog = None
-
-        closeBtn = QPushButton('Stop CatsCradle')
-        closeBtn.clicked.connect(self.initShutdown)
-        layout = QGridLayout(self)
-        layout.addWidget(closeBtn, 1, 1)
-
-        self.setupStep = 0
-
-    def closeEvent(self, event):
-        self.initShutdown()
-        event.accept() # let the window close
-
-    def setup(self):
-        # Raise message boxes to make sure the user properly sets the marionette
-        # before running the AI
-        setupDialog = QMessageBox()
-        setupDialog.setText("Cat's Cradle Setup")
-        setupDialog.setStandardButtons(QMessageBox.Ok | QMessageBox.Close)
-        setupDialog.setDefaultButton(QMessageBox.Ok)
-
-        setupDialog.setInformativeText("Power on Raspberry Pi, \nwait 1 minute\n");
-        ret = setupDialog.exec_();
-        if ret == QMessageBox.Close:
-            return False
-
-        if not TEST_WIHOUT_RASP:
-            # Wait for 60
-            delay = 60
-            if "--testUI" in sys.argv:
-                delay = 5
-            progress = QProgressDialog("Starting Raspberry Pi...", None, 0, delay)
-            progress.setWindowModality(Qt.WindowModal)
-
-            for i in range(0, delay):
-                progress.setValue(i)
-                if (progress.wasCanceled()):
-                    return False
-                time.sleep(1)
-
-            progress.setValue(delay);
-
-            # Try port connection and warn user if failed
-            self.ac = ArduinoCommunicator.ArduinoCommunicator("/dev/ttyUSB0")
-            if self.ac.serial_port is None:
-                errorDialog = QMessageBox()
-                errorDialog.setText("ERROR")
-                errorDialog.setIcon(QMessageBox.Critical)
-                errorDialog.setInformativeText("Port not found.\nMake sure the Raspberry Pi is connected to the right port\n")
-                errorDialog.setStandardButtons(QMessageBox.Ok)
-                errorDialog.setDefaultButton(QMessageBox.Ok)
-                errorDialog.exec_()
-                if not "--testUI" in sys.argv:
-                    return False
-
-        self.setupStep = 1
-
-        setupDialog.setInformativeText("If necessary, plug main camera into battery\n");
-        ret = setupDialog.exec_();
-        if ret == QMessageBox.Close:
-            return False
-
-        self.setupStep = 2
-
-        setupDialog.setInformativeText("Power on motors and rear camera\n");
-        ret = setupDialog.exec_();
-        if ret == QMessageBox.Close:
-            return False
-
-        self.setupStep = 3
-
-        return True
-
-
-    def initShutdown(self):
-        if self.realRun:
-            self.realRun.stop()
-
-
-    def shutdown(self):
-        # Raise message boxes to make sure the user properly shuts down the marionette
-        shutdownDialog = QMessageBox()
-        shutdownDialog.setText("Cat's Cradle Shutdown")
-        shutdownDialog.setStandardButtons(QMessageBox.Ok)
-        shutdownDialog.setDefaultButton(QMessageBox.Ok)
-
-        if self.setupStep > 2:
-            shutdownDialog.setInformativeText("Turn Off Motors\n")
-            shutdownDialog.exec_()
-
-        if self.setupStep > 0:
-            shutdownDialog.setInformativeText("Turn Off Rasberry Pi\n")
-            shutdownDialog.exec_()
-
-    def checkCameras(self):
-        # load the cameras
-        front_camera = cv2.VideoCapture(FRONT_CAMERA)
-        back_camera = cv2.VideoCapture(BACK_CAMERA)
-
-        # test cameras and warn user if one is missing
-        retFont, frame = front_camera.read()
-        retBack, frame = back_camera.read()
-
-        # release the cameras
-        if front_camera:
-            front_camera.release()
-        if back_camera:
-            back_camera.release()
-
-        msg = ""
-        result = True
-        if not retFont:
-            msg = "The front camera is not connected. The application will not be launched."
-            result = False
-        elif not retBack:
-            msg = "The back camera is not connected. The application will be launched without the back camera."
-
-        if msg is not "":
-            cameraDialog = QMessageBox()
-            cameraDialog.setText("ERROR")
-            cameraDialog.setStandardButtons(QMessageBox.Ok)
-            cameraDialog.setDefaultButton(QMessageBox.Ok)
-
-            cameraDialog.setInformativeText(msg)
-            cameraDialog.exec_()
-
-        return result
-
-
 class RunCatsCradle(object):
-    def __init__(self, returnToZero=True, app=None):
+    def __init__(self, returnToZero=True, app=None, headless=False):
         self.app = app
         self.returnToZero = returnToZero
+        # no windows, no plots and no Qt
+        self.headless = headless
         self.running = False
 
     def run(self):
@@ -182,22 +44,34 @@ class RunCatsCradle(object):
         cameraMaxX = 1920
         cameraMaxY = 1080
 
+        # the person sensor is created first: its prediction processes load their models
+        # while the other modules are loading
+        start_time = time.time()
+        person_sensor = PersonSensor(display=not self.headless)
+
+        print('Started Person Sensor (%.1fs)...\n' % (time.time() - start_time))
+
+        start_time = time.time()
         actionModule = ActionModule(cameraMaxX, cameraMaxY, dummy="--dummyAction" in sys.argv)
 
-        print('Loaded Action Module...\n')
+        print('Loaded Action Module (%.1fs)...\n' % (time.time() - start_time))
 
+        start_time = time.time()
         response_module = ResponseModule(actionModule)
 
-        print('Loaded Response Module...\n')
+        print('Loaded Response Module (%.1fs)...\n' % (time.time() - start_time))
 
-        emotion_module = EmotionModule(response_module, visualise=True)
+        start_time = time.time()
+        emotion_module = EmotionModule(response_module, visualise=not self.headless)
 
-        print('Loaded Emotion Module...\n')
+        print('Loaded Emotion Module (%.1fs)...\n' % (time.time() - start_time))
 
-        sensor_module = SensorModule(emotion_module)
+        start_time = time.time()
+        sensor_module = SensorModule(emotion_module, personSensor=person_sensor)
         sensor_module.loadReactors()
 
-        print('Loaded Sensor Module...\n')
+        # the main loop starts without waiting for the models: faces are detected once they are loaded
+        print('Loaded Sensor Module (%.1fs)...\n' % (time.time() - start_time))
 
         # loading the camera should happen after sensor module is initialized but before loading camera for the sensor module
         front_camera = cv2.VideoCapture(FRONT_CAMERA)
@@ -209,6 +83,14 @@ class RunCatsCradle(object):
         back_camera.set(cv2.CAP_PROP_FRAME_HEIGHT, cameraMaxY)
         sensor_module.loadSensors(front_camera, back_camera)
 
+        # draw the camera windows from the Qt event loop rather than from the sensing code
+        displayTimer = None
+        if self.app is not None and not person_sensor.display_sink.in_thread:
+            from PyQt5.QtCore import QTimer
+            displayTimer = QTimer()
+            displayTimer.timeout.connect(person_sensor.display_sink.render)
+            displayTimer.start(int(1000 / DISPLAY_MAX_FPS))
+
         while self.running:
 
             sensor_module.update()
@@ -218,17 +100,20 @@ class RunCatsCradle(object):
                 self.app.processEvents()
             else:
                 # Hit 'q' on the keyboard to quit
-                if cv2.waitKey(1) & 0xFF == ord('q'):
+                if ord('q') in sensor_module.personSensor.display_sink.keys():
                    self.running = False
 
 
         print("stopping...")
+        if displayTimer is not None:
+            displayTimer.stop()
         sensor_module.cleanup()
         if front_camera:
             front_camera.release()
         if back_camera:
             back_camera.release()
-        cv2.destroyAllWindows()
+        if not self.headless:
+            cv2.destroyAllWindows()
 
         # Clear the current queue
         actionModule.clearQueue()
@@ -244,7 +129,32 @@ class RunCatsCradle(object):
         self.running = False
 
 
+def run_headless():
+    """
+    Runs without any UI (no Qt, no plots, no windows). Stop with SIGINT or SIGTERM.
+    """
+
+    run = RunCatsCradle(returnToZero=True, app=None, headless=True)
+
+    def stop(signum, frame):
+        print("signal " + str(signum) + " received.")
+        run.stop()
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    run.run()
+
+
 if __name__ == "__main__":
+    if "--headless" in sys.argv:
+        run_headless()
+        sys.exit(0)
+
+    # the UI is only loaded when it is used
+    from PyQt5.QtWidgets import QApplication
+    from AppRun import AppRun
+
     noSetup = False
     noShutdown = False
     returnToZero = True
@@ -256,14 +166,14 @@ if __name__ == "__main__":
     app = QApplication(sys.argv)
 
     run = RunCatsCradle(returnToZero, app)
-    appWidget = AppRun(run)
+    appWidget = AppRun(run, TEST_WIHOUT_RASP)
 
     launch = True
     if not noSetup:
         launch = appWidget.setup()
 
     if launch and not "--noCameraCheck" in sys.argv:
-        launch = appWidget.checkCameras()
+        launch = appWidget.checkCameras(FRONT_CAMERA, BACK_CAMERA)
 
     if "--dummyAction" in sys.argv:
         launch = True
@@ -0,0 +1,161 @@
+"""
+Runs the back camera motion measure of MotionDetector side by side with the full size
+pipeline it replaced, on the same frames, to check that the amounts of motion (and so
+ResponseModule.BACK_MOVEMENT_RESPONSE_MIN and BACK_MOVEMENT_RESPONSE_FACTOR) keep their meaning
+for a given downsampling factor and threshold (see MotionDetector.DOWNSAMPLED_MOTION_THRESHOLDS).
+
+Usage: python test_motion_detector.py [camera index, video file or "synthetic"] [downsample] [threshold]
+"synthetic" moves crops of the images of imgs/ over 1080p backgrounds made of the other ones.
+Press Esc to stop and print the summary.
+"""
+
+import glob
+import sys
+import time
+
+import cv2
+import numpy as np
+
+from MotionDetector import MotionDetector, MOTION_DOWNSAMPLE
+from ResponseModule import BACK_MOVEMENT_RESPONSE_MIN, BACK_MOVEMENT_RESPONSE_FACTOR
+
+winName = "Motion -- full size | MotionDetector"
+
+# synthetic sequences: number of sequences, frames per sequence and camera noise
+SYNTHETIC_SEQUENCES = 24
+SYNTHETIC_FRAMES = 8
+SYNTHETIC_NOISE = 3
+
+
+def frame_distance(frame1, frame2):
+    """outputs pythagorean distance between two frames"""
+    frame1_32 = np.float32(frame1)
+    frame2_32 = np.float32(frame2)
+    diff32 = frame1_32 - frame2_32
+    norm32 = np.sqrt(diff32[:,:,0]**2 + diff32[:,:,1]**2 + diff32[:,:,2]**2)/np.sqrt(255**2 + 255**2 + 255**2)
+    dist = np.uint8(norm32*255)
+    return dist
+
+
+def full_size_motion(frame, previous_frame):
+    """The motion measure of PersonSensor.update_back_camera before MotionDetector."""
+    dist = frame_distance(frame, previous_frame)
+    mod = cv2.GaussianBlur(dist, (9,9), 0)
+    _, threshold = cv2.threshold(mod, 100, 255, 0)
+    half = int(frame.shape[1]/2)
+    _, stdev_left = cv2.meanStdDev(threshold[:,:half])
+    _, stdev_right = cv2.meanStdDev(threshold[:,half:])
+    return stdev_left[0][0], stdev_right[0][0], threshold
+
+
+def camera_frames(source):
+    """The frames of a camera or a video file."""
+    cam = cv2.VideoCapture(source)
+    while True:
+        ret, frame = cam.read()
+        if not ret:
+            return
+        yield frame
+
+
+def synthetic_frames(seed=0):
+    """
+    Sequences of 1080p frames with 1 to 3 crops of the images of imgs/ moving over a background,
+    with camera noise. None is returned between two sequences.
+    """
+    rng = np.random.RandomState(seed)
+    images = [cv2.imread(path) for path in sorted(glob.glob('imgs/*.jpg'))]
+    for sequence in range(SYNTHETIC_SEQUENCES):
+        background = cv2.resize(images[rng.randint(len(images))], (1920, 1080))
+        objects = []
+        for i in range(rng.randint(1, 4)):
+            w, h = rng.randint(30, 450), rng.randint(30, 700)
+            objects.append((cv2.resize(images[rng.randint(len(images))], (w, h)),
+                            rng.randint(0, 1900 - w), rng.randint(0, 1070 - h), rng.randint(-25, 26), rng.randint(-10, 11)))
+        for t in range(SYNTHETIC_FRAMES):
+            frame = background.copy()
+            for image, x, y, vx, vy in objects:
+                h, w = image.shape[:2]
+                x_t = int(np.clip(x + vx * t, 0, 1920 - w))
+                y_t = int(np.clip(y + vy * t, 0, 1080 - h))
+                frame[y_t:y_t+h, x_t:x_t+w] = image
+            noise = rng.normal(0, SYNTHETIC_NOISE, frame.shape).astype(np.int16)
+            yield np.clip(frame.astype(np.int16) + noise, 0, 255).astype(np.uint8)
+        yield None
+
+
+def summary(name, amounts):
+    """Prints the amounts of motion and how often they would trigger a response (see ResponseModule)."""
+    amounts = np.array(amounts)
+    triggers = amounts > BACK_MOVEMENT_RESPONSE_MIN
+    probas = np.where(triggers, np.minimum(amounts / BACK_MOVEMENT_RESPONSE_FACTOR, 1), 0)
+    values = (name, amounts.mean(), amounts.max(), np.count_nonzero(triggers), probas.mean())
+    print "%-16s mean %7.2f  max %7.2f  above min %5d  mean response proba %.3f" % values
+
+
+if __name__ == "__main__":
+    source = 0
+    if len(sys.argv) > 1:
+        source = int(sys.argv[1]) if sys.argv[1].isdigit() else sys.argv[1]
+    downsample = MOTION_DOWNSAMPLE
+    if len(sys.argv) > 2:
+        downsample = int(sys.argv[2])
+    threshold = None
+    if len(sys.argv) > 3:
+        threshold = int(sys.argv[3])
+
+    show = source != "synthetic"
+    if show:
+        frames = camera_frames(source)
+        cv2.namedWindow(winName, cv2.WINDOW_NORMAL)
+    else:
+        frames = synthetic_frames()
+    detector = MotionDetector(downsample, threshold=threshold)
+
+    full_size_amounts = []
+    detector_amounts = []
+    detector_time = 0.0
+    previous_frame = None
+    for frame in frames:
+        if frame is None:
+            # next sequence
+            detector.reset()
+            previous_frame = None
+            continue
+
+        start_time = time.time()
+        left, right = detector.update(frame)
+        detector_time += time.time() - start_time
+        if not previous_frame is None:
+            full_left, full_right, threshold_image = full_size_motion(frame, previous_frame)
+            full_size_amounts.extend([full_left, full_right])
+            detector_amounts.extend([left, right])
+            print "%7.2f %7.2f | %7.2f %7.2f" % (full_left, full_right, left, right)
+
+            if show:
+                mask = cv2.resize(detector.mask, (threshold_image.shape[1], threshold_image.shape[0]),
+                                  interpolation=cv2.INTER_NEAREST)
+                cv2.imshow(winName, np.hstack((threshold_image, mask)))
+        previous_frame = frame
+
+        if show and cv2.waitKey(10) == 27:
+            break
+
+    if show:
+        cv2.destroyWindow(winName)
+    if len(full_size_amounts) == 0:
+        print "No frames"
+        sys.exit(1)
+
+    # amounts of the left and right halves of all the frames
+    full_size_amounts = np.array(full_size_amounts)
+    detector_amounts = np.array(detector_amounts)
+    n_frames = len(full_size_amounts) // 2
+    print "Downsample: %d  threshold: %d  frames: %d  MotionDetector: %.1f ms/frame" % \
+        (downsample, detector.threshold, n_frames, detector_time / n_frames * 1000)
+    summary("full size", full_size_amounts)
+    summary("MotionDetector", detector_amounts)
+    difference = np.abs(detector_amounts - full_size_amounts)
+    print "Mean / max absolute difference: %.2f / %.2f" % (difference.mean(), difference.max())
+    same_triggers = (detector_amounts > BACK_MOVEMENT_RESPONSE_MIN) == (full_size_amounts > BACK_MOVEMENT_RESPONSE_MIN)
+    print "Same response trigger: %.1f%%" % (100.0 * np.mean(same_triggers))